@@ -16,16 +16,19 @@ from pyrogram.errors import FloodWait, MessageNotModified
 
 from Thunder import __version__
 from Thunder.bot import StreamBot
-from Thunder.bot.clients import cleanup_clients, initialize_clients
+from Thunder.bot.clients import cleanup_clients, export_sessions, initialize_clients
 from Thunder.server import web_server
 from Thunder.utils.commands import set_commands
 from Thunder.utils.database import db
+from Thunder.utils.download_pool import download_pool
 from Thunder.utils.keepalive import ping_server
 from Thunder.utils.logger import logger
+from Thunder.utils.media_sessions import media_session_pool
 from Thunder.utils.messages import MSG_ADMIN_RESTART_DONE
 from Thunder.utils.rate_limiter import rate_limiter, request_executor
 from Thunder.utils.tokens import cleanup_expired_tokens
 from Thunder.vars import Var
+from Thunder.workers import WorkerPool
 
 
 PLUGIN_PATH = "Thunder/bot/plugins/*.py"
@@ -162,6 +165,14 @@ async def start_services():
         logger.error(f"   ✖ Failed to initialize clients: {e}", exc_info=True)
         return
 
+    # Bots are signed in once, here; stream and download workers resume
+    # these sessions.
+    worker_pool = None
+    if Var.WEB_WORKERS > 1:
+        worker_pool = WorkerPool(Var.WEB_WORKERS, await export_sessions())
+    else:
+        download_pool.start(await export_sessions())
+
     await import_plugins()
 
     print("   ▶ Starting Request Executor initialization...")
@@ -178,11 +189,21 @@ async def start_services():
 
     print("   ▶ Starting Web Server initialization...")
     try:
-        app_runner = web.AppRunner(await web_server())
-        await app_runner.setup()
         bind_address = Var.BIND_ADDRESS
-        site = web.TCPSite(app_runner, bind_address, Var.PORT)
-        await site.start()
+        if worker_pool is not None:
+            worker_pool.start()
+            print(f"   ✓ Started {worker_pool.count} stream workers")
+            server_task = asyncio.create_task(
+                worker_pool.supervise(), name="worker_supervisor_task"
+            )
+        else:
+            app_runner = web.AppRunner(await web_server())
+            await app_runner.setup()
+            site = web.TCPSite(app_runner, bind_address, Var.PORT)
+            await site.start()
+            server_task = asyncio.create_task(
+                media_session_pool.run(), name="media_session_task"
+            )
 
         keepalive_task = asyncio.create_task(
             ping_server(), name="keepalive_task"
@@ -212,6 +233,8 @@ async def start_services():
             await rate_limiter.shutdown()
         except Exception:
             pass
+        if worker_pool is not None:
+            await worker_pool.stop()
         return
 
     elapsed_time = (datetime.now() - start_time).total_seconds()
@@ -219,6 +242,8 @@ async def start_services():
     print(f"   ▶ Bot Name: {bot_info.first_name}")
     print(f"   ▶ Username: @{bot_info.username}")
     print(f"   ▶ Server: {bind_address}:{Var.PORT}")
+    if worker_pool is not None:
+        print(f"   ▶ Stream Workers: {worker_pool.count}")
     print(f"   ▶ Startup Time: {elapsed_time:.2f} seconds")
     print("╚═══════════════════════════════════════════════════════════╝")
     print("   ▶ Bot is now running! Press CTRL+C to stop.")
@@ -226,7 +251,8 @@ async def start_services():
     background_tasks = [
         request_executor_task,
         keepalive_task,
-        token_cleanup_task
+        token_cleanup_task,
+        server_task
     ]
 
     try:
@@ -247,6 +273,17 @@ async def start_services():
         except Exception as e:
             logger.error(f"Error during rate limiter cleanup: {e}")
 
+        if worker_pool is not None:
+            try:
+                await worker_pool.stop()
+            except Exception as e:
+                logger.error(f"Error stopping stream workers: {e}")
+
+        try:
+            await download_pool.stop()
+        except Exception as e:
+            logger.error(f"Error stopping download workers: {e}")
+
         try:
             await cleanup_clients()
         except Exception as e:
@@ -21,7 +21,13 @@ async def cleanup_clients():
         except Exception as e:
             logger.error(f"Error stopping client: {e}", exc_info=True)
 
-async def initialize_clients():
+async def export_sessions():
+    # Authorized sessions of the running clients. Worker processes resume
+    # them instead of logging every bot token in again.
+    return {client_id: await client.export_session_string()
+            for client_id, client in multi_clients.items()}
+
+async def initialize_clients(sessions=None):
     print("╠══════════════════ INITIALIZING CLIENTS ═══════════════════╣")
     multi_clients[0] = StreamBot
     work_loads[0] = 0
@@ -44,6 +50,7 @@ async def initialize_clients():
                 api_hash=Var.API_HASH,
                 api_id=Var.API_ID,
                 bot_token=token,
+                session_string=(sessions or {}).get(client_id),
                 in_memory=True,
                 name=str(client_id),
                 no_updates=True,
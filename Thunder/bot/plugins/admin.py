@@ -16,7 +16,7 @@ from pyrogram.errors import FloodWait, MessageNotModified
 from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup, Message
 
 from Thunder import StartTime, __version__
-from Thunder.bot import StreamBot, multi_clients, work_loads
+from Thunder.bot import StreamBot, multi_clients
 from Thunder.utils.bot_utils import reply
 from Thunder.utils.broadcast import broadcast_message
 from Thunder.utils.database import db
@@ -44,6 +44,7 @@ from Thunder.utils.messages import (
 from Thunder.utils.time_format import get_readable_time
 from Thunder.utils.tokens import authorize, deauthorize, list_allowed
 from Thunder.utils.speedtest import run_speedtest
+from Thunder.utils.worker_loads import shared_loads
 from Thunder.vars import Var
 
 owner_filter = filters.private & filters.user(Var.OWNER_ID)
@@ -73,14 +74,15 @@ async def show_status(client: Client, message: Message):
     try:
         uptime_str = get_readable_time(int(time.time() - StartTime))
         workload_items = ""
-        sorted_workloads = sorted(work_loads.items(), key=lambda item: item[0])
+        loads = shared_loads.totals()
+        sorted_workloads = sorted(loads.items(), key=lambda item: item[0])
         for client_id, load_val in sorted_workloads:
             workload_items += MSG_WORKLOAD_ITEM.format(
                 bot_name=f"🔹 Client {client_id}", load=load_val)
 
-        total_workload = sum(work_loads.values())
+        total_workload = sum(loads.values())
         status_text_str = MSG_SYSTEM_STATUS.format(
-            uptime=uptime_str, active_bots=len(multi_clients),
+            uptime=uptime_str, active_bots=len(loads) if shared_loads.active else len(multi_clients),
             total_workload=total_workload, workload_items=workload_items,
             version=__version__)
         await reply(message,
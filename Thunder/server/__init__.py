@@ -1,9 +1,13 @@
 # Thunder/server/__init__.py
 
 from aiohttp import web
-from .stream_routes import routes
 
 async def web_server():
+    # The routes pull in the streaming and bot utilities, which themselves
+    # import Thunder.server.exceptions; loading them here rather than at
+    # package import keeps that from being a cycle.
+    from .stream_routes import routes
+
     web_app = web.Application(client_max_size=30000000)
     web_app.add_routes(routes)
     return web_app
@@ -1,40 +1,61 @@
 # Thunder/server/stream_routes.py
 
+import asyncio
+import math
+import os
 import re
+import select
 import secrets
 import time
+from collections.abc import AsyncGenerator
+from email.utils import formatdate
+from typing import BinaryIO
 from urllib.parse import quote, unquote
 
 from aiohttp import web
+from pyrogram.errors import FloodWait
 
 from Thunder import __version__, StartTime
 from Thunder.bot import StreamBot, multi_clients, work_loads
 from Thunder.server.exceptions import FileNotFound, InvalidHash
-from Thunder.utils.custom_dl import ByteStreamer
+from Thunder.utils.admission import BULK, INTERACTIVE, admission_controller
+from Thunder.utils.bandwidth import SLICE_SIZE, ShapedConnection, bandwidth_shaper
+from Thunder.utils.chunk_cache import chunk_cache
+from Thunder.utils.client_scheduler import client_scheduler
+from Thunder.utils.custom_dl import (ByteStreamer, StreamLane, boundary_chunks,
+                                     chunk_flights, get_indexed_file_info,
+                                     get_seek_index, get_streamer,
+                                     playback_pacer, schedule_warmup,
+                                     stream_buffer_budget, stream_with_failover)
+from Thunder.utils.database import db
+from Thunder.utils.disk_cache import disk_cache
+from Thunder.utils.download_pool import download_pool
+from Thunder.utils.file_cache import file_info_cache
 from Thunder.utils.logger import logger
+from Thunder.utils.media_sessions import media_session_pool
+from Thunder.utils.pinned_cache import pinned_cache
 from Thunder.utils.render_template import render_page
+from Thunder.utils.seek_index import seek_index_cache
 from Thunder.utils.time_format import get_readable_time
+from Thunder.utils.worker_loads import shared_loads
+from Thunder.vars import Var
 
 routes = web.RouteTableDef()
 
 SECURE_HASH_LENGTH = 6
 CHUNK_SIZE = 1024 * 1024
-MAX_CONCURRENT_PER_CLIENT = 8
-RANGE_REGEX = re.compile(r"bytes=(?P<start>\d*)-(?P<end>\d*)")
+RANGE_REGEX = re.compile(r"(?P<start>\d*)-(?P<end>\d*)")
+MAX_RANGES = 16
+# Bytes handed to one os.sendfile call, which runs on the event loop, and
+# how long a wait for the socket to drain may block its thread.
+SENDFILE_BLOCK = 1024 * 1024
+WRITABLE_POLL_MS = 1000
+FLUSH_POLL = 0.005
 PATTERN_HASH_FIRST = re.compile(
     rf"^([a-zA-Z0-9_-]{{{SECURE_HASH_LENGTH}}})(\d+)(?:/.*)?$")
 PATTERN_ID_FIRST = re.compile(r"^(\d+)(?:/.*)?$")
 VALID_HASH_REGEX = re.compile(r'^[a-zA-Z0-9_-]+$')
 
-streamers = {}
-
-
-def get_streamer(client_id: int) -> ByteStreamer:
-    if client_id not in streamers:
-        streamers[client_id] = ByteStreamer(multi_clients[client_id])
-    return streamers[client_id]
-
-
 def parse_media_request(path: str, query: dict) -> tuple[int, str]:
     clean_path = unquote(path).strip('/')
 
@@ -65,52 +86,324 @@ def parse_media_request(path: str, query: dict) -> tuple[int, str]:
     raise InvalidHash("Invalid URL structure or missing hash")
 
 
-def select_optimal_client() -> tuple[int, ByteStreamer]:
+def select_stripe_clients(count: int, dc_id: int | None = None) -> list[tuple[int, ByteStreamer]]:
     if not work_loads:
         raise web.HTTPInternalServerError(
             text=("No available clients to handle the request. "
                   "Please try again later."))
 
-    available_clients = [
-        (cid, load) for cid, load in work_loads.items()
-        if load < MAX_CONCURRENT_PER_CLIENT]
+    chosen = client_scheduler.rank(dc_id)[:count]
+    return [(cid, get_streamer(cid)) for cid in chosen]
+
+
+async def resolve_file_info(message_id: int) -> dict:
+    file_info = await get_indexed_file_info(message_id)
+    if file_info is not None:
+        return file_info
+
+    for client_id, streamer in select_stripe_clients(len(work_loads)):
+        work_loads[client_id] += 1
+        try:
+            return await streamer.fetch_file_info(message_id)
+        except FloodWait:
+            continue
+        finally:
+            work_loads[client_id] -= 1
+
+    raise web.HTTPServiceUnavailable(
+        text="All clients are rate limited. Please try again later.")
+
+
+def client_ip(request: web.Request) -> str:
+    return admission_controller.resolve_ip(
+        request.remote, request.headers.get("X-Forwarded-For", ""))
+
+
+async def write_shaped(response: web.StreamResponse, shaped: ShapedConnection,
+                       data: bytes) -> None:
+    # Shaped writes go out in small slices so pacing stays smooth instead
+    # of one long sleep per 1 MiB chunk.
+    if not bandwidth_shaper.limited:
+        await shaped.throttle(len(data))
+        await response.write(data)
+        return
+    view = memoryview(data)
+    for pos in range(0, len(view), SLICE_SIZE):
+        piece = view[pos:pos + SLICE_SIZE]
+        await shaped.throttle(len(piece))
+        await response.write(piece)
+
+
+async def write_file(response: web.StreamResponse, shaped: ShapedConnection,
+                     fobj: BinaryIO, offset: int, count: int) -> None:
+    fobj.seek(offset)
+    while count > 0:
+        chunk = await asyncio.to_thread(fobj.read, min(CHUNK_SIZE, count))
+        if not chunk:
+            break
+        await write_shaped(response, shaped, chunk)
+        count -= len(chunk)
+
+
+def socket_fd(transport: asyncio.Transport) -> int | None:
+    # Plain TCP sockets only: TLS has to go through the transport.
+    if not hasattr(os, "sendfile") or transport.get_extra_info("sslcontext") is not None:
+        return None
+    sock = transport.get_extra_info("socket")
+    return sock.fileno() if sock is not None else None
+
+
+def wait_writable(fd: int) -> None:
+    poller = select.poll()
+    poller.register(fd, select.POLLOUT)
+    poller.poll(WRITABLE_POLL_MS)
+
+
+async def sendfile_to_socket(transport: asyncio.Transport, fd: int,
+                             fobj: BinaryIO, offset: int, count: int) -> None:
+    # uvloop, which every entry point installs, has no loop.sendfile, so
+    # the file goes to the socket with os.sendfile directly. The response
+    # headers must leave the transport's buffer first. Writes stay on the
+    # event loop, where the transport closes its socket, so a descriptor
+    # reused after a disconnect is never written to; only the wait for a
+    # full socket buffer runs in a thread.
+    while transport.get_write_buffer_size():
+        await asyncio.sleep(FLUSH_POLL)
+    while count > 0:
+        if transport.is_closing():
+            raise ConnectionResetError("Connection lost")
+        try:
+            sent = os.sendfile(fd, fobj.fileno(), offset, min(count, SENDFILE_BLOCK))
+        except BlockingIOError:
+            await asyncio.to_thread(wait_writable, fd)
+            continue
+        except (BrokenPipeError, ConnectionError) as e:
+            raise ConnectionResetError(str(e)) from e
+        if not sent:
+            raise ConnectionResetError("Cached file ended early")
+        offset += sent
+        count -= sent
+
+
+async def send_cached_range(request: web.Request, status: int, headers: dict,
+                            path: str, offset: int, count: int) -> web.StreamResponse | None:
+    # Returns None when the cached file cannot be opened, so the caller
+    # serves the range upstream instead.
+    try:
+        fobj = await asyncio.to_thread(open, path, 'rb')
+    except OSError as e:
+        logger.debug(f"Disk cache file unavailable, streaming upstream: {e}")
+        return None
+    response = web.StreamResponse(status=status, headers=headers)
+    shaped = bandwidth_shaper.open(client_ip(request))
+    try:
+        await response.prepare(request)
+        transport = request.transport
+        if transport is None:
+            raise ConnectionResetError("Connection lost")
+        fd = socket_fd(transport)
+        if bandwidth_shaper.limited or fd is None:
+            await write_file(response, shaped, fobj, offset, count)
+        else:
+            await sendfile_to_socket(transport, fd, fobj, offset, count)
+        await response.write_eof()
+    except ConnectionResetError as e:
+        logger.debug(f"Client disconnected during cached transfer: {e}")
+        if request.transport is not None:
+            request.transport.close()
+    finally:
+        bandwidth_shaper.close(shaped)
+        fobj.close()
+    return response
+
+
+async def send_stream(request: web.Request, status: int, headers: dict,
+                      body: AsyncGenerator[bytes, None]) -> web.StreamResponse:
+    # Each write waits for the socket to drain below its high-water mark,
+    # so the generator, and with it upstream read-ahead, only advances as
+    # fast as the client actually reads.
+    response = web.StreamResponse(status=status, headers=headers)
+    transport = request.transport
+    if transport is not None:
+        transport.set_write_buffer_limits(high=Var.STREAM_WRITE_BUFFER_KB * 1024)
+    shaped = bandwidth_shaper.open(client_ip(request))
+    try:
+        await response.prepare(request)
+        async for chunk in body:
+            await write_shaped(response, shaped, chunk)
+        await response.write_eof()
+    except ConnectionResetError as e:
+        logger.debug(f"Client disconnected during stream: {e}")
+    except Exception as e:
+        if not response.prepared:
+            raise
+        error_id = secrets.token_hex(6)
+        logger.error(f"Stream error {error_id}: {e}", exc_info=True)
+        if request.transport is not None:
+            request.transport.close()
+    finally:
+        bandwidth_shaper.close(shaped)
+        await body.aclose()
+    return response
+
+
+def request_qos(request: web.Request) -> str:
+    # Media element requests, seeks and small bounded ranges are
+    # interactive; whole-file downloads and large segments are bulk, also
+    # when started from the /watch page.
+    if request.headers.get("Sec-Fetch-Dest", "") in ("video", "audio"):
+        return INTERACTIVE
+    range_header = request.headers.get("Range", "")
+    if not range_header.startswith("bytes=") or "," in range_header:
+        return BULK
+    match = RANGE_REGEX.fullmatch(range_header[len("bytes="):].strip())
+    if not match:
+        return BULK
+    start_str, end_str = match.group("start"), match.group("end")
+    if not start_str:
+        return INTERACTIVE
+    if not end_str:
+        return INTERACTIVE if int(start_str) > 0 else BULK
+    length = int(end_str) - int(start_str) + 1
+    return INTERACTIVE if length <= Var.INTERACTIVE_RANGE_MB * 1024 * 1024 else BULK
 
-    if available_clients:
-        client_id = min(available_clients, key=lambda x: x[1])[0]
-    else:
-        client_id = min(work_loads, key=work_loads.get)
 
-    return client_id, get_streamer(client_id)
+def is_playback(request: web.Request) -> bool:
+    # Media element requests and ?t= seeks are paced to the file's bitrate.
+    # The Referer is not used: the /watch page's Download button sends it
+    # too, and a plain download must not be paced.
+    return (request.headers.get("Sec-Fetch-Dest", "") in ("video", "audio") or
+            "t" in request.query)
 
 
-def parse_range_header(range_header: str, file_size: int) -> tuple[int, int]:
+def parse_range_header(range_header: str, file_size: int) -> list[tuple[int, int]]:
     if not range_header:
-        return 0, file_size - 1
+        return [(0, file_size - 1)]
 
-    match = RANGE_REGEX.match(range_header)
-    if not match:
+    if not range_header.startswith("bytes="):
         raise web.HTTPBadRequest(text=f"Invalid range header: {range_header}")
 
-    start_str = match.group("start")
-    end_str = match.group("end")
-    if start_str:
-        start = int(start_str)
-        end = int(end_str) if end_str else file_size - 1
-    else:
-        if not end_str:
+    specs = range_header[len("bytes="):].split(",")
+    if len(specs) > MAX_RANGES:
+        raise web.HTTPRequestRangeNotSatisfiable(
+            headers={"Content-Range": f"bytes */{file_size}"})
+
+    ranges = []
+    for spec in specs:
+        match = RANGE_REGEX.fullmatch(spec.strip())
+        if not match:
             raise web.HTTPBadRequest(text=f"Invalid range header: {range_header}")
-        suffix_len = int(end_str)
-        if suffix_len <= 0:
-            raise web.HTTPRequestRangeNotSatisfiable(headers={"Content-Range": f"bytes */{file_size}"})
-        start = max(file_size - suffix_len, 0)
-        end = file_size - 1
 
-    if start < 0 or end >= file_size or start > end:
+        start_str = match.group("start")
+        end_str = match.group("end")
+        if start_str:
+            start = int(start_str)
+            if end_str and int(end_str) < start:
+                raise web.HTTPRequestRangeNotSatisfiable(
+                    headers={"Content-Range": f"bytes */{file_size}"})
+            end = min(int(end_str), file_size - 1) if end_str else file_size - 1
+        else:
+            if not end_str:
+                raise web.HTTPBadRequest(text=f"Invalid range header: {range_header}")
+            suffix_len = int(end_str)
+            if suffix_len <= 0:
+                continue
+            start = max(file_size - suffix_len, 0)
+            end = file_size - 1
+
+        if start < file_size:
+            ranges.append((start, end))
+
+    if not ranges:
         raise web.HTTPRequestRangeNotSatisfiable(
-            headers={"Content-Range": f"bytes */{file_size}"}
-        )
+            headers={"Content-Range": f"bytes */{file_size}"})
+
+    ranges.sort()
+    merged = [ranges[0]]
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def parse_seek_time(value: str) -> float:
+    try:
+        seconds = float(value)
+    except ValueError:
+        seconds = -1.0
+    if not math.isfinite(seconds) or seconds < 0:
+        raise web.HTTPBadRequest(text=f"Invalid seek time: {value}")
+    return seconds
+
 
-    return start, end
+async def seek_position(message_id: int, file_info: dict,
+                        seconds: float) -> tuple[float, int] | None:
+    # A seek that cannot be resolved falls back to the start of the file.
+    try:
+        index = await get_seek_index(message_id, file_info)
+    except Exception as e:
+        logger.debug(f"Seek index unavailable for {message_id}: {e}")
+        return None
+    return index.lookup(seconds) if index else None
+
+
+def file_etag(file_info: dict) -> str:
+    return f'"{file_info["unique_id"]}-{file_info.get("file_size", 0)}"'
+
+
+def etag_matches(header: str, etag: str) -> bool:
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def is_not_modified(request: web.Request, etag: str, last_modified: int) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.if_modified_since
+    return bool(last_modified and if_modified_since and
+                last_modified <= if_modified_since.timestamp())
+
+
+def range_still_valid(request: web.Request, etag: str, last_modified: int) -> bool:
+    if_range = request.headers.get("If-Range")
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == etag
+    if_range_date = request.if_range
+    return bool(last_modified and if_range_date and
+                int(if_range_date.timestamp()) == last_modified)
+
+
+def build_range_parts(ranges: list[tuple[int, int]], file_size: int,
+                      mime_type: str) -> tuple[str, list[tuple[bytes, int, int]], bytes]:
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        return mime_type, [(b"", start, end)], b""
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    for start, end in ranges:
+        head = (f"--{boundary}\r\n"
+                f"Content-Type: {mime_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n")
+        if parts:
+            head = "\r\n" + head
+        parts.append((head.encode(), start, end))
+    closing = f"\r\n--{boundary}--\r\n".encode()
+    return f"multipart/byteranges; boundary={boundary}", parts, closing
 
 
 # Thunder/server/stream_routes.py
@@ -129,9 +422,21 @@ async def root_redirect(request):
 @routes.get("/status", allow_head=True)
 async def status_endpoint(request):
     uptime = time.time() - StartTime
-    total_load = sum(work_loads.values())
-
-    workload_distribution = {str(k): v for k, v in sorted(work_loads.items())}
+    loads = shared_loads.totals()
+    total_load = sum(loads.values())
+
+    workload_distribution = {str(k): v for k, v in sorted(loads.items())}
+
+    workers = {}
+    if shared_loads.active:
+        workers = {
+            "count": shared_loads.workers,
+            "this_worker": shared_loads.index,
+            "workload": {
+                str(index): sum(worker.values())
+                for index, worker in shared_loads.per_worker().items()
+            }
+        }
 
     return web.json_response({
         "server": {
@@ -145,9 +450,27 @@ async def status_endpoint(request):
         },
         "resources": {
             "total_workload": total_load,
-            "workload_distribution": workload_distribution
-
-        }
+            "workload_distribution": workload_distribution,
+            "workers": workers
+        },
+        "cache": {
+            "file_info": file_info_cache.stats(),
+            "chunks": chunk_cache.stats(),
+            "pinned": pinned_cache.stats(),
+            "seek_index": seek_index_cache.stats(),
+            "disk": disk_cache.stats()
+        },
+        "read_ahead": {
+            "per_stream": Var.READ_AHEAD_CHUNKS,
+            "pacing_seconds": Var.PACING_SECONDS
+        },
+        "stream_buffers": stream_buffer_budget.stats(),
+        "single_flight": chunk_flights.stats(),
+        "download_workers": download_pool.stats(),
+        "bandwidth": bandwidth_shaper.stats(),
+        "admission": admission_controller.stats(),
+        "scheduler": client_scheduler.scores(),
+        "media_sessions": media_session_pool.stats()
     })
 
 
@@ -174,110 +497,205 @@ async def media_preview(request: web.Request):
             text=f"Server error occurred: {error_id}") from e
 
 
+@routes.get(r"/seek/{path:.+}", allow_head=True)
+async def seek_endpoint(request: web.Request):
+    try:
+        path = request.match_info["path"]
+        message_id, secure_hash = parse_media_request(path, request.query)
+
+        file_info = await resolve_file_info(message_id)
+        unique_id = file_info.get('unique_id')
+        if not unique_id or unique_id[:SECURE_HASH_LENGTH] != secure_hash:
+            raise InvalidHash(
+                "Provided hash does not match file's unique ID.")
+
+        index = await get_seek_index(message_id, file_info)
+        if index is None:
+            raise web.HTTPNotFound(text="No seek index for this file")
+
+        if "t" not in request.query:
+            return web.json_response(index.to_dict())
+        seconds = parse_seek_time(request.query["t"])
+        keyframe_time, offset = index.lookup(seconds)
+        return web.json_response({
+            "container": index.container,
+            "t": seconds,
+            "time": round(keyframe_time, 3),
+            "offset": offset,
+            "range": f"bytes={offset}-"
+        })
+
+    except (InvalidHash, FileNotFound) as e:
+        logger.debug(
+            f"Client error in seek: {type(e).__name__} - {e}",
+            exc_info=True)
+        raise web.HTTPNotFound(text="Resource not found") from e
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        error_id = secrets.token_hex(6)
+        logger.error(f"Seek error {error_id}: {e}", exc_info=True)
+        raise web.HTTPInternalServerError(
+            text=f"Server error occurred: {error_id}") from e
+
+
 @routes.get(r"/{path:.+}", allow_head=True)
 async def media_delivery(request: web.Request):
+    ip = client_ip(request)
+    if not admission_controller.try_acquire(ip):
+        raise web.HTTPServiceUnavailable(
+            text="Too many concurrent streams from this address.",
+            headers={"Retry-After": str(admission_controller.retry_after)})
+    try:
+        return await deliver_media(request)
+    finally:
+        admission_controller.release(ip)
+
+
+async def deliver_media(request: web.Request):
     try:
         path = request.match_info["path"]
         message_id, secure_hash = parse_media_request(path, request.query)
 
-        client_id, streamer = select_optimal_client()
+        file_info = await resolve_file_info(message_id)
 
-        work_loads[client_id] += 1
+        if not file_info.get('unique_id'):
+            raise FileNotFound("File unique ID not found in info.")
 
-        try:
-            file_info = await streamer.get_file_info(message_id)
-            if not file_info.get('unique_id'):
-                raise FileNotFound("File unique ID not found in info.")
-
-            if (file_info['unique_id'][:SECURE_HASH_LENGTH] !=
-                    secure_hash):
-                raise InvalidHash(
-                    "Provided hash does not match file's unique ID.")
-
-            file_size = file_info.get('file_size', 0)
-            if file_size == 0:
-                raise FileNotFound(
-                    "File size is reported as zero or unavailable.")
-
-            range_header = request.headers.get("Range", "")
-            start, end = parse_range_header(range_header, file_size)
-            content_length = end - start + 1
-
-            if start == 0 and end == file_size - 1:
-                range_header = ""
-
-            mime_type = (
-                file_info.get('mime_type') or 'application/octet-stream')
-            filename = (
-                file_info.get('file_name') or f"file_{secrets.token_hex(4)}")
-
-            headers = {
-                "Content-Type": mime_type,
-                "Content-Length": str(content_length),
-                "Content-Disposition": (
-                    f"inline; filename*=UTF-8''{quote(filename)}"),
-                "Accept-Ranges": "bytes",
-                "Cache-Control": "public, max-age=31536000",
-                "Connection": "keep-alive"
-            }
+        if (file_info['unique_id'][:SECURE_HASH_LENGTH] !=
+                secure_hash):
+            raise InvalidHash(
+                "Provided hash does not match file's unique ID.")
 
-            if range_header:
-                headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        file_size = file_info.get('file_size', 0)
+        if file_size == 0:
+            raise FileNotFound(
+                "File size is reported as zero or unavailable.")
 
-            if request.method == 'HEAD':
-                work_loads[client_id] -= 1
-                return web.Response(
-                    status=206 if range_header else 200,
-                    headers=headers
-                )
+        etag = file_etag(file_info)
+        last_modified = file_info.get('date', 0)
+        validators = {
+            "ETag": etag,
+            "Cache-Control": "public, max-age=31536000"
+        }
+        if last_modified:
+            validators["Last-Modified"] = formatdate(last_modified, usegmt=True)
+
+        if is_not_modified(request, etag, last_modified):
+            return web.Response(status=304, headers=validators)
+
+        range_header = request.headers.get("Range", "")
+        if range_header and not range_still_valid(request, etag, last_modified):
+            range_header = ""
+
+        # ?t=seconds turns into a range starting at the keyframe before it,
+        # answered as 206 with Content-Range so the client learns where the
+        # body starts, plus X-Seek-Time. A Range header wins over ?t=;
+        # browsers always send one, so players should resolve the offset
+        # through /seek and request that range themselves.
+        seek_time = None
+        if not range_header and "t" in request.query:
+            seek = await seek_position(
+                message_id, file_info, parse_seek_time(request.query["t"]))
+            if seek is not None and seek[1] > 0:
+                seek_time = seek[0]
+                range_header = f"bytes={seek[1]}-"
+        ranges = parse_range_header(range_header, file_size)
+        start, end = ranges[0]
+
+        if ranges == [(0, file_size - 1)]:
+            range_header = ""
+
+        mime_type = (
+            file_info.get('mime_type') or 'application/octet-stream')
+        content_type, parts, closing = build_range_parts(
+            ranges, file_size, mime_type)
+        fetch_length = sum(e - s + 1 for s, e in ranges)
+        content_length = fetch_length + len(closing) + sum(
+            len(head) for head, _, _ in parts)
+        filename = (
+            file_info.get('file_name') or f"file_{secrets.token_hex(4)}")
+
+        headers = {
+            "Content-Type": content_type,
+            "Content-Length": str(content_length),
+            "Content-Disposition": (
+                f"inline; filename*=UTF-8''{quote(filename)}"),
+            "Accept-Ranges": "bytes",
+            "Connection": "keep-alive",
+            **validators
+        }
 
-            async def stream_generator():
-                try:
-                    bytes_sent = 0
-                    bytes_to_skip = start % CHUNK_SIZE
-
-                    async for chunk in streamer.stream_file(
-                            message_id, offset=start, limit=content_length):
-                        if bytes_to_skip > 0:
-                            if len(chunk) <= bytes_to_skip:
-                                bytes_to_skip -= len(chunk)
-                                continue
-                            chunk = chunk[bytes_to_skip:]
-                            bytes_to_skip = 0
-
-                        remaining = content_length - bytes_sent
-                        if len(chunk) > remaining:
-                            chunk = chunk[:remaining]
-
-                        if chunk:
-                            yield chunk
-                            bytes_sent += len(chunk)
+        if range_header and len(ranges) == 1:
+            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+        if seek_time is not None:
+            headers["X-Seek-Time"] = f"{seek_time:.3f}"
 
-                        if bytes_sent >= content_length:
-                            break
-                finally:
-                    work_loads[client_id] -= 1
+        if request.method == 'HEAD':
             return web.Response(
                 status=206 if range_header else 200,
-                body=stream_generator(),
                 headers=headers
             )
 
-        except (FileNotFound, InvalidHash):
-            work_loads[client_id] -= 1
-            raise
-        except Exception as e:
-            work_loads[client_id] -= 1
-            error_id = secrets.token_hex(6)
-            logger.error(
-                f"Stream error {error_id}: {e}",
-                exc_info=True)
-            raise web.HTTPInternalServerError(
-                text=f"Server error during streaming: {error_id}") from e
+        # Only responses that carry a body take a QoS slot; 304s, HEADs and
+        # range errors were answered above without queueing.
+        if not await admission_controller.enter(request_qos(request)):
+            raise web.HTTPServiceUnavailable(
+                text="Server is busy. Please try again later.",
+                headers={"Retry-After": str(admission_controller.retry_after)})
+        try:
+            if (len(ranges) == 1 and
+                    disk_cache.has_range(file_info['unique_id'], start, end)):
+                response = await send_cached_range(
+                    request, 206 if range_header else 200, headers,
+                    disk_cache.data_path(file_info['unique_id']), start, content_length)
+                if response is not None:
+                    return response
+
+            if start == 0 and is_playback(request):
+                # A player starting from the top will probe the tail next.
+                schedule_warmup(message_id, exclude=(0,))
+
+            dc_id = file_info.get('dc_id')
+            stripe_count = min(Var.STRIPE_CLIENTS, len(work_loads))
+            if (stripe_count < 2 or
+                    fetch_length < Var.STRIPE_MIN_SIZE_MB * 1024 * 1024):
+                stripe_count = 1
+            lanes = [StreamLane(streamer, message_id)
+                     for _, streamer in select_stripe_clients(stripe_count, dc_id)]
+            pacer = None
+            if len(ranges) == 1 and is_playback(request):
+                pacer = playback_pacer(file_info, start)
+
+            shared = boundary_chunks(ranges)
+
+            async def stream_generator():
+                try:
+                    for head, part_start, part_end in parts:
+                        if head:
+                            yield head
+                        async for chunk in stream_with_failover(
+                                lanes, message_id, part_start,
+                                part_end - part_start + 1, pacer, shared):
+                            yield chunk
+                    if closing:
+                        yield closing
+                except FileNotFound:
+                    file_info_cache.invalidate(message_id)
+                    await db.delete_file(message_id)
+                    raise
+
+            return await send_stream(
+                request, 206 if range_header else 200, headers,
+                stream_generator())
+        finally:
+            admission_controller.leave()
 
     except (InvalidHash, FileNotFound) as e:
         logger.debug(f"Client error: {type(e).__name__} - {e}", exc_info=True)
         raise web.HTTPNotFound(text="Resource not found") from e
+    except web.HTTPException:
+        raise
     except Exception as e:
         error_id = secrets.token_hex(6)
         logger.error(f"Server error {error_id}: {e}", exc_info=True)
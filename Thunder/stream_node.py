@@ -0,0 +1,62 @@
+# Thunder/stream_node.py
+
+import asyncio
+import signal
+
+from uvloop import install
+
+install()
+
+from Thunder import __version__
+from Thunder.utils.logger import logger
+from Thunder.vars import Var
+from Thunder.bot.clients import cleanup_clients, export_sessions
+from Thunder.workers import WorkerPool, serve_streams, start_media_clients
+
+
+async def supervise_workers(count: int) -> None:
+    # The node signs its bots in once and hands the sessions to its workers.
+    await start_media_clients()
+    worker_pool = WorkerPool(count, await export_sessions())
+    worker_pool.start()
+    supervisor_task = asyncio.create_task(
+        worker_pool.supervise(), name="worker_supervisor_task")
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await stop_event.wait()
+    finally:
+        supervisor_task.cancel()
+        try:
+            await supervisor_task
+        except asyncio.CancelledError:
+            pass
+        await worker_pool.stop()
+        await cleanup_clients()
+
+
+async def start_node() -> None:
+    # Streaming only: no update handling, plugins, request executor or
+    # keepalive, so any number of nodes can run behind a load balancer
+    # next to the single bot instance.
+    print("╔═════════════════ STARTING STREAM NODE ════════════════════╗")
+    print(f"   ▶ Version: {__version__}")
+    print(f"   ▶ Server: {Var.BIND_ADDRESS}:{Var.PORT}")
+    if Var.WEB_WORKERS > 1:
+        print(f"   ▶ Stream Workers: {Var.WEB_WORKERS}")
+        await supervise_workers(Var.WEB_WORKERS)
+    else:
+        await serve_streams()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(start_node())
+    except KeyboardInterrupt:
+        print("   ▶ Stream node stopped by user (CTRL+C)")
+    except Exception as e:
+        logger.error(f"Stream node stopped with an error: {e}", exc_info=True)
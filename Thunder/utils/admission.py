@@ -0,0 +1,211 @@
+# Thunder/utils/admission.py
+
+import asyncio
+import ipaddress
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+from Thunder.bot import work_loads
+from Thunder.utils.logger import logger
+from Thunder.utils.worker_loads import shared_ip_streams
+from Thunder.vars import Var
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+# Interactive waiters handed a slot in a row before a queued bulk
+# download gets one, so bulk is deprioritised but never starved.
+INTERACTIVE_TURNS = 4
+
+
+def parse_networks(value: str) -> List[IPNetwork]:
+    networks: List[IPNetwork] = []
+    for item in value.replace(',', ' ').split():
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning(f"Ignoring invalid trusted proxy address: {item}")
+    return networks
+
+
+class AdmissionController:
+    # Counts open media requests per client address and turns away new
+    # ones over the limit before they cost a Telegram call. Requests that
+    # pass are then given one of MAX_CONCURRENT_PER_CLIENT slots per
+    # client; when all are taken they wait in a bounded queue per QoS
+    # class, and a freed slot goes straight to the next waiter.
+    def __init__(self, per_ip_limit: int, retry_after: int, trusted_proxies: str,
+                 per_client_limit: int, queue_size: int, queue_timeout: int) -> None:
+        self.per_ip_limit = per_ip_limit
+        self.retry_after = retry_after
+        self.trusted = parse_networks(trusted_proxies)
+        self.per_client_limit = per_client_limit
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._active: Dict[str, int] = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.slots_in_use = 0
+        self._turns = 0
+        self._queues: Dict[str, Deque[Tuple[asyncio.Future, float]]] = {
+            INTERACTIVE: deque(), BULK: deque()}
+        self._queue_stats: Dict[str, Dict[str, float]] = {
+            qos: {"served": 0, "queued": 0, "timeouts": 0, "rejected": 0,
+                  "wait_total": 0.0, "wait_max": 0.0}
+            for qos in self._queues}
+
+    def _is_trusted(self, address: str) -> bool:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return False
+        return any(ip in network for network in self.trusted)
+
+    def resolve_ip(self, remote: Optional[str], forwarded_for: str) -> str:
+        # X-Forwarded-For is only honoured when the peer is a trusted proxy.
+        # The chain is walked from the right so a client cannot spoof its
+        # address by prepending entries.
+        address = remote or "unknown"
+        if not self.trusted or not forwarded_for or not self._is_trusted(address):
+            return address
+        for hop in reversed([h.strip() for h in forwarded_for.split(',') if h.strip()]):
+            address = hop
+            if not self._is_trusted(hop):
+                break
+        return address
+
+    def try_acquire(self, ip: str) -> bool:
+        active = self._active.get(ip, 0)
+        if self.per_ip_limit > 0 and active + shared_ip_streams.elsewhere(ip) >= self.per_ip_limit:
+            self.rejected += 1
+            return False
+        self._active[ip] = active + 1
+        shared_ip_streams.add(ip, 1)
+        self.admitted += 1
+        return True
+
+    def release(self, ip: str) -> None:
+        shared_ip_streams.add(ip, -1)
+        remaining = self._active.get(ip, 0) - 1
+        if remaining > 0:
+            self._active[ip] = remaining
+        else:
+            self._active.pop(ip, None)
+
+    @property
+    def capacity(self) -> int:
+        if self.per_client_limit <= 0:
+            return 0
+        return self.per_client_limit * max(1, len(work_loads))
+
+    def queue_depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def enter(self, qos: str) -> bool:
+        capacity = self.capacity
+        if not capacity or (self.slots_in_use < capacity and not self.queue_depth()):
+            self.slots_in_use += 1
+            self._record_wait(qos, 0.0)
+            return True
+
+        stats = self._queue_stats[qos]
+        if self.queue_depth() >= self.queue_size:
+            stats["rejected"] += 1
+            return False
+
+        waiter = asyncio.get_running_loop().create_future()
+        started = time.monotonic()
+        entry = (waiter, started)
+        self._queues[qos].append(entry)
+        stats["queued"] += 1
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            stats["timeouts"] += 1
+            self._abandon(qos, entry)
+            return False
+        except asyncio.CancelledError:
+            self._abandon(qos, entry)
+            raise
+        self._record_wait(qos, time.monotonic() - started)
+        return True
+
+    def _abandon(self, qos: str, entry: Tuple[asyncio.Future, float]) -> None:
+        # A waiter that gives up leaves the queue at once, so it no longer
+        # counts against the queue size or the wait metrics. A slot handed
+        # to it in the meantime goes to the next waiter.
+        waiter, _ = entry
+        try:
+            self._queues[qos].remove(entry)
+        except ValueError:
+            pass
+        if waiter.done() and not waiter.cancelled():
+            self.leave()
+
+    def leave(self) -> None:
+        waiter = self._next_waiter()
+        if waiter is not None:
+            waiter.set_result(None)
+        else:
+            self.slots_in_use -= 1
+
+    def _next_waiter(self) -> Optional[asyncio.Future]:
+        interactive, bulk = self._queues[INTERACTIVE], self._queues[BULK]
+        while interactive or bulk:
+            if interactive and (not bulk or self._turns < INTERACTIVE_TURNS):
+                self._turns += 1
+                waiter, _ = interactive.popleft()
+            else:
+                self._turns = 0
+                waiter, _ = bulk.popleft()
+            if not waiter.done():
+                return waiter
+        return None
+
+    def _record_wait(self, qos: str, waited: float) -> None:
+        stats = self._queue_stats[qos]
+        stats["served"] += 1
+        stats["wait_total"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+
+    def queue_stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        classes = {}
+        for qos, queue in self._queues.items():
+            stats = self._queue_stats[qos]
+            classes[qos] = {
+                "depth": len(queue),
+                "oldest_wait": round(now - queue[0][1], 2) if queue else 0.0,
+                "served": stats["served"],
+                "queued": stats["queued"],
+                "timeouts": stats["timeouts"],
+                "rejected": stats["rejected"],
+                "avg_wait": round(stats["wait_total"] / stats["served"], 3) if stats["served"] else 0.0,
+                "max_wait": round(stats["wait_max"], 3)
+            }
+        return {
+            "capacity": self.capacity,
+            "slots_in_use": self.slots_in_use,
+            "max_depth": self.queue_size,
+            "timeout": self.queue_timeout,
+            "classes": classes
+        }
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        busiest = sorted(self._active.items(), key=lambda item: item[1], reverse=True)[:top]
+        return {
+            "per_ip_limit": self.per_ip_limit,
+            "active_ips": len(self._active),
+            "active_streams": sum(self._active.values()),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "top_ips": dict(busiest),
+            "queue": self.queue_stats()
+        }
+
+
+admission_controller = AdmissionController(
+    Var.MAX_STREAMS_PER_IP, Var.STREAM_RETRY_AFTER, Var.TRUSTED_PROXIES,
+    Var.MAX_CONCURRENT_PER_CLIENT, Var.ADMISSION_QUEUE_SIZE, Var.ADMISSION_QUEUE_TIMEOUT)
@@ -0,0 +1,145 @@
+# Thunder/utils/bandwidth.py
+
+import asyncio
+import time
+from typing import Any, Dict, List
+
+from Thunder.utils.worker_loads import shared_ip_streams
+from Thunder.vars import Var
+
+BURST_SECONDS = 0.25
+RATE_WINDOW = 2.0
+SLICE_SIZE = 64 * 1024
+
+
+class TokenBucket:
+    # The balance may go negative: a write larger than what is available is
+    # let through and the writer then sleeps off the debt, so callers never
+    # have to match their write size to the bucket.
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated',
+                 'window_start', 'window_bytes', 'last_rate')
+
+    def __init__(self, rate: int) -> None:
+        now = time.monotonic()
+        self.rate = rate
+        self.capacity = max(rate * BURST_SECONDS, SLICE_SIZE)
+        self.tokens = self.capacity
+        self.updated = now
+        self.window_start = now
+        self.window_bytes = 0
+        self.last_rate = 0.0
+
+    def reserve(self, nbytes: int, now: float) -> float:
+        elapsed = now - self.window_start
+        if elapsed >= RATE_WINDOW:
+            self.last_rate = self.window_bytes / elapsed
+            self.window_start = now
+            self.window_bytes = 0
+        self.window_bytes += nbytes
+
+        if not self.rate:
+            return 0.0
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate) - nbytes
+        self.updated = now
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def current_rate(self, now: float) -> float:
+        elapsed = now - self.window_start
+        if elapsed >= RATE_WINDOW:
+            return self.window_bytes / elapsed
+        return self.last_rate
+
+
+class ShapedConnection:
+    __slots__ = ('shaper', 'ip', 'buckets')
+
+    def __init__(self, shaper: "BandwidthShaper", ip: str, buckets: List[TokenBucket]) -> None:
+        self.shaper = shaper
+        self.ip = ip
+        self.buckets = buckets
+
+    async def throttle(self, nbytes: int) -> None:
+        self.shaper.share_ip_rate(self.ip)
+        now = time.monotonic()
+        delay = 0.0
+        for bucket in self.buckets:
+            delay = max(delay, bucket.reserve(nbytes, now))
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class BandwidthShaper:
+    # Egress is charged against three buckets: one for the process, one
+    # per client IP (shared by all of its connections) and one per
+    # connection. A write waits for whichever bucket is furthest in debt.
+    # With several web workers, an IP's rate is split between them by how
+    # many of its streams each one is serving.
+    def __init__(self, global_rate: int, per_ip_rate: int, per_connection_rate: int) -> None:
+        self.per_ip_rate = per_ip_rate
+        self.per_connection_rate = per_connection_rate
+        self.global_bucket = TokenBucket(global_rate)
+        self._ip_buckets: Dict[str, TokenBucket] = {}
+        self._ip_connections: Dict[str, int] = {}
+        self._connections: List[ShapedConnection] = []
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.global_bucket.rate or self.per_ip_rate or self.per_connection_rate)
+
+    def open(self, ip: str) -> ShapedConnection:
+        ip_bucket = self._ip_buckets.get(ip)
+        if ip_bucket is None:
+            ip_bucket = self._ip_buckets[ip] = TokenBucket(self.per_ip_rate)
+        self._ip_connections[ip] = self._ip_connections.get(ip, 0) + 1
+        connection = ShapedConnection(
+            self, ip, [TokenBucket(self.per_connection_rate), ip_bucket, self.global_bucket])
+        self._connections.append(connection)
+        return connection
+
+    def share_ip_rate(self, ip: str) -> None:
+        if not self.per_ip_rate or not shared_ip_streams.active:
+            return
+        local = self._ip_connections[ip]
+        self._ip_buckets[ip].rate = max(
+            1, self.per_ip_rate * local // (local + shared_ip_streams.elsewhere(ip)))
+
+    def close(self, connection: ShapedConnection) -> None:
+        self._connections.remove(connection)
+        remaining = self._ip_connections[connection.ip] - 1
+        if remaining:
+            self._ip_connections[connection.ip] = remaining
+        else:
+            del self._ip_connections[connection.ip]
+            del self._ip_buckets[connection.ip]
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        now = time.monotonic()
+        per_ip = sorted(
+            ((ip, bucket.current_rate(now)) for ip, bucket in self._ip_buckets.items()),
+            key=lambda item: item[1], reverse=True)[:top]
+        connection_rates = [c.buckets[0].current_rate(now) for c in self._connections]
+        return {
+            "limits": {
+                "global": self.global_bucket.rate,
+                "per_ip": self.per_ip_rate,
+                "per_connection": self.per_connection_rate
+            },
+            "global_rate": round(self.global_bucket.current_rate(now)),
+            "connections": len(self._connections),
+            "max_connection_rate": round(max(connection_rates, default=0.0)),
+            "top_ips": {
+                ip: {"rate": round(rate), "connections": self._ip_connections[ip]}
+                for ip, rate in per_ip
+            }
+        }
+
+
+def _rate(kbps: int) -> int:
+    return max(0, kbps) * 1024
+
+
+bandwidth_shaper = BandwidthShaper(
+    _rate(Var.BANDWIDTH_GLOBAL_KBPS),
+    _rate(Var.BANDWIDTH_PER_IP_KBPS),
+    _rate(Var.BANDWIDTH_PER_CONNECTION_KBPS))
@@ -10,13 +10,16 @@ from pyrogram.errors import FloodWait
 from pyrogram.types import (InlineKeyboardButton, InlineKeyboardMarkup,
                             Message, User)
 
+from Thunder.utils.custom_dl import ByteStreamer, schedule_warmup
 from Thunder.utils.database import db
+from Thunder.utils.file_cache import file_info_cache
 from Thunder.utils.file_properties import get_fname, get_fsize, get_hash
 from Thunder.utils.human_readable import humanbytes
 from Thunder.utils.logger import logger
 from Thunder.utils.messages import (MSG_BUTTON_GET_HELP, MSG_DC_UNKNOWN,
                                     MSG_DC_USER_INFO, MSG_NEW_USER)
 from Thunder.utils.shortener import shorten
+from Thunder.utils.worker_loads import shared_loads
 from Thunder.vars import Var
 
 
@@ -86,6 +89,14 @@ async def gen_links(fwd_msg: Message, shortener: bool = True) -> Dict[str, str]:
     m_size_hr = humanbytes(get_fsize(fwd_msg))
     enc_fname = quote(m_name)
     f_hash = get_hash(fwd_msg)
+    file_info = ByteStreamer.get_file_info_sync(fwd_msg)
+    if "error" not in file_info:
+        file_info_cache.set(fid, file_info)
+        await db.add_file(file_info)
+        # With web workers the streams are served elsewhere; the first
+        # /watch render warms their caches instead.
+        if not shared_loads.active:
+            schedule_warmup(fid)
     slink = f"{base_url}/watch/{f_hash}{fid}/{enc_fname}"
     olink = f"{base_url}/{f_hash}{fid}/{enc_fname}"
     
@@ -0,0 +1,110 @@
+# Thunder/utils/chunk_cache.py
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from Thunder.vars import Var
+
+ChunkKey = Tuple[str, int]
+
+PROTECTED_RATIO = 0.8
+
+
+class ChunkCache:
+    # Segmented LRU: new chunks enter the probation segment and are only
+    # promoted to the protected segment on a second hit, so a single
+    # sequential download cannot flush chunks that many viewers share.
+    __slots__ = (
+        'max_bytes', 'protected_max_bytes', '_probation', '_protected',
+        'probation_bytes', 'protected_bytes', 'hits', 'misses', 'evictions')
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max(0, max_bytes)
+        self.protected_max_bytes = int(self.max_bytes * PROTECTED_RATIO)
+        self._probation: OrderedDict[ChunkKey, bytes] = OrderedDict()
+        self._protected: OrderedDict[ChunkKey, bytes] = OrderedDict()
+        self.probation_bytes = 0
+        self.protected_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @property
+    def resident_bytes(self) -> int:
+        return self.probation_bytes + self.protected_bytes
+
+    def contains(self, key: ChunkKey) -> bool:
+        return key in self._protected or key in self._probation
+
+    def get(self, key: ChunkKey) -> Optional[bytes]:
+        data = self._protected.get(key)
+        if data is not None:
+            self._protected.move_to_end(key)
+            self.hits += 1
+            return data
+
+        data = self._probation.pop(key, None)
+        if data is None:
+            self.misses += 1
+            return None
+
+        self.probation_bytes -= len(data)
+        self._protected[key] = data
+        self.protected_bytes += len(data)
+        self._demote_protected()
+        self._evict()
+        self.hits += 1
+        return data
+
+    def put(self, key: ChunkKey, data: bytes) -> None:
+        if not self.enabled or not data or len(data) > self.max_bytes:
+            return
+        if self.contains(key):
+            return
+        self._probation[key] = data
+        self.probation_bytes += len(data)
+        self._evict()
+
+    def clear(self) -> None:
+        self._probation.clear()
+        self._protected.clear()
+        self.probation_bytes = 0
+        self.protected_bytes = 0
+
+    def _demote_protected(self) -> None:
+        while self.protected_bytes > self.protected_max_bytes and self._protected:
+            key, data = self._protected.popitem(last=False)
+            self.protected_bytes -= len(data)
+            self._probation[key] = data
+            self.probation_bytes += len(data)
+
+    def _evict(self) -> None:
+        while self.resident_bytes > self.max_bytes:
+            if self._probation:
+                _, data = self._probation.popitem(last=False)
+                self.probation_bytes -= len(data)
+            else:
+                _, data = self._protected.popitem(last=False)
+                self.protected_bytes -= len(data)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "max_bytes": self.max_bytes,
+            "resident_bytes": self.resident_bytes,
+            "protected_bytes": self.protected_bytes,
+            "probation_bytes": self.probation_bytes,
+            "chunks": len(self._probation) + len(self._protected),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+chunk_cache = ChunkCache(Var.CHUNK_CACHE_SIZE_MB * 1024 * 1024)
@@ -0,0 +1,194 @@
+# Thunder/utils/client_scheduler.py
+
+import time
+from collections import deque
+from typing import Any, Collection, Deque, Dict, List, Optional, Tuple
+
+from Thunder.bot import work_loads
+from Thunder.vars import Var
+
+CHUNK_SIZE = 1024 * 1024
+EWMA_ALPHA = 0.3
+MIN_SAMPLE_SIZE = 256 * 1024
+THROUGHPUT_WINDOW = 10.0
+DEFAULT_CHUNK_TIME = 1.0
+
+HEALTHY = "healthy"
+FLOOD_WAIT = "flood_wait"
+CIRCUIT_OPEN = "circuit_open"
+HALF_OPEN = "half_open"
+
+
+class ClientStats:
+    __slots__ = ('in_flight', 'chunk_time', 'dc_chunk_time', 'transfers',
+                 'bytes_total', 'requests', 'failures', 'consecutive_failures',
+                 'flood_until', 'circuit_until', 'probe_started', 'floods', 'circuit_opens',
+                 'failovers')
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.chunk_time: Optional[float] = None
+        self.dc_chunk_time: Dict[int, float] = {}
+        self.transfers: Deque[Tuple[float, int]] = deque()
+        self.bytes_total = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.flood_until = 0.0
+        self.circuit_until = 0.0
+        self.probe_started: Optional[float] = None
+        self.floods = 0
+        self.circuit_opens = 0
+        self.failovers = 0
+
+    def bytes_per_sec(self, now: float) -> float:
+        while self.transfers and now - self.transfers[0][0] > THROUGHPUT_WINDOW:
+            self.transfers.popleft()
+        return sum(n for _, n in self.transfers) / THROUGHPUT_WINDOW
+
+    def health(self, now: float) -> str:
+        if self.flood_until > now:
+            return FLOOD_WAIT
+        if self.circuit_until > now:
+            return CIRCUIT_OPEN
+        if self.circuit_until:
+            return HALF_OPEN
+        return HEALTHY
+
+
+def _ewma(previous: Optional[float], sample: float) -> float:
+    if previous is None:
+        return sample
+    return previous + EWMA_ALPHA * (sample - previous)
+
+
+class ClientScheduler:
+    # Picks the client expected to finish a new chunk request first:
+    # (in-flight chunk requests + 1) times its smoothed seconds per MiB on
+    # the file's DC. Paused streams hold no requests, so they cost nothing.
+    # Clients waiting out a FloodWait or with an open circuit are skipped
+    # while any other client is available.
+    def __init__(self, failure_threshold: int, cooldown: int) -> None:
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self._clients: Dict[int, ClientStats] = {}
+
+    def _stats(self, client_id: int) -> ClientStats:
+        stats = self._clients.get(client_id)
+        if stats is None:
+            stats = self._clients[client_id] = ClientStats()
+        return stats
+
+    def begin(self, client_id: int) -> float:
+        # The first request after a circuit's cooldown is its probe; no
+        # other work is routed to the client until the probe finishes.
+        stats = self._stats(client_id)
+        stats.in_flight += 1
+        now = time.monotonic()
+        if stats.probe_started is None and stats.health(now) == HALF_OPEN:
+            stats.probe_started = now
+        return now
+
+    def end(self, client_id: int, dc_id: int, nbytes: int, started: float,
+            failed: bool = False) -> None:
+        stats = self._stats(client_id)
+        stats.in_flight -= 1
+        now = time.monotonic()
+        probe = stats.probe_started == started
+        if probe:
+            stats.probe_started = None
+        if failed:
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if probe or stats.consecutive_failures >= self.failure_threshold:
+                stats.circuit_until = now + self.cooldown
+                stats.circuit_opens += 1
+            return
+        if nbytes <= 0:
+            # Cancelled or flood-waited; a half-open client gets another probe.
+            return
+
+        stats.consecutive_failures = 0
+        stats.circuit_until = 0.0
+        stats.requests += 1
+        stats.bytes_total += nbytes
+        stats.transfers.append((now, nbytes))
+        if nbytes >= MIN_SAMPLE_SIZE:
+            sample = (now - started) * CHUNK_SIZE / nbytes
+            stats.chunk_time = _ewma(stats.chunk_time, sample)
+            stats.dc_chunk_time[dc_id] = _ewma(stats.dc_chunk_time.get(dc_id), sample)
+
+    def quarantine(self, client_id: int, seconds: float) -> None:
+        stats = self._stats(client_id)
+        stats.flood_until = max(stats.flood_until, time.monotonic() + seconds)
+        stats.floods += 1
+
+    def record_failover(self, client_id: int) -> None:
+        self._stats(client_id).failovers += 1
+
+    def available(self, client_id: int) -> bool:
+        stats = self._stats(client_id)
+        health = stats.health(time.monotonic())
+        return health == HEALTHY or (health == HALF_OPEN and stats.probe_started is None)
+
+    def has_alternative(self, client_id: int) -> bool:
+        return any(self.available(cid) for cid in work_loads if cid != client_id)
+
+    def _ready_in(self, client_id: int) -> float:
+        stats = self._stats(client_id)
+        now = time.monotonic()
+        return max(0.0, stats.flood_until - now, stats.circuit_until - now)
+
+    def _baseline(self) -> float:
+        # Unmeasured clients are assumed as fast as the best known one so
+        # they get tried.
+        known = [s.chunk_time for s in self._clients.values() if s.chunk_time is not None]
+        return min(known) if known else DEFAULT_CHUNK_TIME
+
+    def chunk_time(self, client_id: int, dc_id: Optional[int] = None) -> float:
+        stats = self._clients.get(client_id)
+        if stats is not None:
+            if dc_id in stats.dc_chunk_time:
+                return stats.dc_chunk_time[dc_id]
+            if stats.chunk_time is not None:
+                return stats.chunk_time
+        return self._baseline()
+
+    def expected_time(self, client_id: int, dc_id: Optional[int] = None) -> float:
+        stats = self._clients.get(client_id)
+        in_flight = stats.in_flight if stats else 0
+        return (in_flight + 1) * self.chunk_time(client_id, dc_id)
+
+    def rank(self, dc_id: Optional[int] = None, exclude: Collection[int] = ()) -> List[int]:
+        candidates = [cid for cid in work_loads if cid not in exclude]
+        healthy = [cid for cid in candidates if self.available(cid)]
+        if healthy:
+            return sorted(healthy, key=lambda cid: (
+                self.expected_time(cid, dc_id), self._stats(cid).requests, cid))
+        return sorted(candidates, key=lambda cid: (
+            self._ready_in(cid), self.expected_time(cid, dc_id), cid))
+
+    def scores(self) -> Dict[str, Dict[str, Any]]:
+        now = time.monotonic()
+        scores = {}
+        for client_id in sorted(work_loads):
+            stats = self._stats(client_id)
+            scores[str(client_id)] = {
+                "health": stats.health(now),
+                "ready_in": round(self._ready_in(client_id), 1),
+                "in_flight": stats.in_flight,
+                "bytes_per_sec": round(stats.bytes_per_sec(now)),
+                "chunk_time": round(self.chunk_time(client_id), 4),
+                "dc_chunk_time": {
+                    str(dc): round(t, 4) for dc, t in sorted(stats.dc_chunk_time.items())},
+                "expected_time": round(self.expected_time(client_id), 4),
+                "requests": stats.requests,
+                "failures": stats.failures,
+                "floods": stats.floods,
+                "circuit_opens": stats.circuit_opens,
+                "failovers": stats.failovers
+            }
+        return scores
+
+
+client_scheduler = ClientScheduler(Var.CIRCUIT_BREAKER_FAILURES, Var.CIRCUIT_BREAKER_COOLDOWN)
@@ -1,31 +1,252 @@
 # Thunder/utils/custom_dl.py
 
 import asyncio
-from typing import Any, AsyncGenerator, Dict
+import time
+from collections import deque
+from typing import (Any, AsyncGenerator, Awaitable, Callable, Collection, Deque,
+                    Dict, Hashable, List, Optional, Set, Tuple, Union)
 
-from pyrogram import Client
-from pyrogram.errors import FloodWait
+from pyrogram import Client, raw
+from pyrogram.errors import FileReferenceExpired, FloodWait
+from pyrogram.file_id import FileId, FileType
+from pyrogram.session import Session
 from pyrogram.types import Message
 
+from Thunder.bot import multi_clients, work_loads
 from Thunder.server.exceptions import FileNotFound
+from Thunder.utils.chunk_cache import chunk_cache
+from Thunder.utils.client_scheduler import client_scheduler
+from Thunder.utils.database import db
+from Thunder.utils.disk_cache import disk_cache
+from Thunder.utils.download_pool import DownloadWorkerError, download_pool
+from Thunder.utils.file_cache import file_info_cache
+from Thunder.utils.file_properties import get_fsize, get_media, get_uniqid, parse_fid
 from Thunder.utils.logger import logger
+from Thunder.utils.media_sessions import media_session_pool
+from Thunder.utils.pinned_cache import pinned_cache
+from Thunder.utils.seek_index import (SeekIndex, SeekIndexError, build_index, is_seekable,
+                                      seek_index_cache)
 from Thunder.vars import Var
 
+CHUNK_SIZE = 1024 * 1024
+MAX_STREAM_RESUMES = 3
+# upload.GetFile accepts limits that are 4 KiB multiples dividing 1 MiB,
+# at offsets aligned to the limit.
+MIN_PART_SIZE = 4 * 1024
+FIRST_PART_SIZE = 64 * 1024
+# Pacing runs this much faster than the average bitrate so variable
+# bitrate peaks and player buffering do not stall playback.
+PLAYBACK_RATE_MARGIN = 1.5
+
+
+class StreamBufferBudget:
+    # Bytes of upstream data held by streams: a read-ahead chunk from the
+    # moment it is requested until its stream takes it, and the chunk a
+    # stream is fetching or writing out. Read-ahead only starts while the
+    # total stays under the limit. A stream's own chunk waits for room in
+    # FIFO order, unless the stream already holds read-ahead it can only
+    # free by making progress; then it is counted without waiting.
+    __slots__ = ('limit', 'reserved_bytes', 'waits', '_held', '_waiters')
+
+    def __init__(self, limit: int) -> None:
+        self.limit = max(0, limit)
+        self.reserved_bytes = 0
+        self.waits = 0
+        self._held: Dict[asyncio.Future, int] = {}
+        self._waiters: Deque[Tuple[asyncio.Future, int]] = deque()
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._held)
+
+    def _fits(self, nbytes: int) -> bool:
+        return self.reserved_bytes == 0 or self.reserved_bytes + nbytes <= self.limit
+
+    def try_acquire(self, nbytes: int) -> bool:
+        if self._waiters or self.reserved_bytes + nbytes > self.limit:
+            return False
+        self.reserved_bytes += nbytes
+        return True
+
+    def track(self, task: asyncio.Future, nbytes: int) -> None:
+        self._held[task] = nbytes
+
+    def adopt(self, task: asyncio.Future) -> int:
+        # Hands a read-ahead task's bytes over to the stream consuming it.
+        return self._held.pop(task, 0)
+
+    def release(self, task: asyncio.Future) -> None:
+        self.free(self._held.pop(task, 0))
+
+    async def acquire(self, nbytes: int, wait: bool = True) -> int:
+        if not wait or self.limit == 0 or (not self._waiters and self._fits(nbytes)):
+            self.reserved_bytes += nbytes
+            return nbytes
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, nbytes)
+        self._waiters.append(entry)
+        self.waits += 1
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+            elif not waiter.cancelled():
+                self.free(nbytes)
+            raise
+        return nbytes
+
+    def free(self, nbytes: int) -> None:
+        self.reserved_bytes -= nbytes
+        while self._waiters and self._fits(self._waiters[0][1]):
+            waiter, reserved = self._waiters.popleft()
+            if not waiter.done():
+                self.reserved_bytes += reserved
+                waiter.set_result(None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit_bytes": self.limit,
+            "reserved_bytes": self.reserved_bytes,
+            "read_ahead_in_flight": self.in_flight,
+            "waiting": len(self._waiters),
+            "waits": self.waits
+        }
+
+
+stream_buffer_budget = StreamBufferBudget(Var.STREAM_BUFFER_MB * 1024 * 1024)
+
+
+class PlaybackPacer:
+    # Keeps a media response's upstream fetches within `ahead_seconds` of
+    # playback: no further than that past the bytes already handed to the
+    # socket, nor past where a viewer playing since the response started
+    # could be. A paused viewer therefore stops costing fetches once the
+    # window is full.
+    __slots__ = ('rate', 'ahead_bytes', 'start', 'started')
+
+    def __init__(self, bytes_per_sec: float, ahead_seconds: float, start: int) -> None:
+        self.rate = bytes_per_sec * PLAYBACK_RATE_MARGIN
+        self.ahead_bytes = int(bytes_per_sec * ahead_seconds)
+        self.start = start
+        self.started = time.monotonic()
+
+    def allowed_end(self, delivered: int) -> int:
+        played = self.start + int((time.monotonic() - self.started) * self.rate)
+        return min(delivered, played) + self.ahead_bytes
+
+    def delay(self, offset: int) -> float:
+        # Seconds until a fetch starting at `offset` fits in the window.
+        return (offset - self.ahead_bytes - self.start) / self.rate - (
+            time.monotonic() - self.started)
+
+
+def is_playable(file_info: Dict[str, Any]) -> bool:
+    return (file_info.get('mime_type') or '').startswith(('video/', 'audio/'))
+
+
+def playback_pacer(file_info: Dict[str, Any], start: int) -> Optional[PlaybackPacer]:
+    if Var.PACING_SECONDS <= 0 or not is_playable(file_info):
+        return None
+    duration = file_info.get('duration') or 0
+    if not duration:
+        # Files indexed before durations were stored may have a seek index.
+        index = seek_index_cache.get(file_info.get('unique_id') or '')
+        duration = index.duration if index else 0
+    file_size = file_info.get('file_size', 0)
+    if duration <= 0 or file_size <= 0:
+        return None
+    return PlaybackPacer(file_size / duration, Var.PACING_SECONDS, start)
+
+
+class SingleFlight:
+    # Concurrent loads of the same (unique_id, chunk) share one upstream
+    # fetch. The fetch is cancelled once its last waiter goes away.
+    __slots__ = ('_calls', 'started', 'coalesced', 'cancelled')
+
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, List[Any]] = {}
+        self.started = 0
+        self.coalesced = 0
+        self.cancelled = 0
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[bytes]]) -> bytes:
+        call = self._calls.get(key)
+        if call is None:
+            task = asyncio.ensure_future(factory())
+            task.add_done_callback(_consume_task_error)
+            call = self._calls[key] = [task, 0]
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        call[1] += 1
+        try:
+            return await asyncio.shield(call[0])
+        finally:
+            call[1] -= 1
+            if call[1] == 0:
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                if not call[0].done():
+                    call[0].cancel()
+                    self.cancelled += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._calls),
+            "upstream_fetches": self.started,
+            "fetches_saved": self.coalesced,
+            "cancelled": self.cancelled
+        }
+
+
+chunk_flights = SingleFlight()
+
+streamers: Dict[int, "ByteStreamer"] = {}
+
+
+def get_streamer(client_id: int) -> "ByteStreamer":
+    if client_id not in streamers:
+        streamers[client_id] = ByteStreamer(multi_clients[client_id], client_id)
+    return streamers[client_id]
+
+
+class LaneError(Exception):
+    # An upstream failure in stream_lanes, with the client the failing
+    # lane was on.
+    def __init__(self, client_id: Optional[int], error: Exception) -> None:
+        super().__init__(str(error))
+        self.client_id = client_id
+        self.error = error
+
+
 class ByteStreamer:
-    __slots__ = ('client', 'chat_id')
+    __slots__ = ('client', 'client_id', 'chat_id')
 
-    def __init__(self, client: Client) -> None:
+    def __init__(self, client: Client, client_id: Optional[int] = None) -> None:
         self.client = client
+        self.client_id = client_id
         self.chat_id = int(Var.BIN_CHANNEL)
 
+    async def wait_flood(self, e: FloodWait, action: str) -> None:
+        # A flooded client is quarantined. The FloodWait is raised so the
+        # caller can retry on another client, and only slept out here when
+        # no other client is available.
+        if self.client_id is not None:
+            client_scheduler.quarantine(self.client_id, e.value)
+            if client_scheduler.has_alternative(self.client_id):
+                raise e
+        logger.debug(f"FloodWait: {action}, sleep {e.value}s")
+        await asyncio.sleep(e.value)
+
     async def get_message(self, message_id: int) -> Message:
         while True:
             try:
                 message = await self.client.get_messages(self.chat_id, message_id)
                 break
             except FloodWait as e:
-                logger.debug(f"FloodWait: get_message, sleep {e.value}s")
-                await asyncio.sleep(e.value)
+                await self.wait_flood(e, "get_message")
             except Exception as e:
                 logger.debug(f"Error fetching message {message_id}: {e}", exc_info=True)
                 raise FileNotFound(f"Message {message_id} not found") from e
@@ -34,38 +255,579 @@ class ByteStreamer:
             raise FileNotFound(f"Message {message_id} not found")
         return message
 
-    async def stream_file(self, message_id: int, offset: int = 0, limit: int = 0) -> AsyncGenerator[bytes, None]:
-        message = await self.get_message(message_id)
-        
-        chunk_offset = offset // (1024 * 1024)
-        chunk_limit = (limit + (1024 * 1024) - 1) // (1024 * 1024) if limit > 0 else 0
+    async def get_media_session(self, dc_id: int) -> Session:
+        return await media_session_pool.get(self.client, dc_id)
+
+    @staticmethod
+    def get_location(file_id: FileId) -> Union[
+            raw.types.InputPhotoFileLocation, raw.types.InputDocumentFileLocation]:
+        if file_id.file_type == FileType.PHOTO:
+            return raw.types.InputPhotoFileLocation(
+                id=file_id.media_id,
+                access_hash=file_id.access_hash,
+                file_reference=file_id.file_reference,
+                thumb_size=file_id.thumbnail_size)
+        return raw.types.InputDocumentFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size)
+
+    async def request_part(self, file_id: FileId, offset: int, limit: int) -> bytes:
+        # A single GetFile round trip, run in a download worker process when
+        # the pool is up. FloodWait is raised to the caller. A failure of the
+        # pool itself falls back to this process, so it never counts
+        # against the client's circuit breaker.
+        if self.client_id is not None and download_pool.enabled:
+            try:
+                return await download_pool.fetch(self.client_id, file_id, offset, limit)
+            except DownloadWorkerError as e:
+                logger.debug(f"Fetching part in process after download pool error: {e}")
+        media_session = await self.get_media_session(file_id.dc_id)
+        result = await media_session.invoke(
+            raw.functions.upload.GetFile(
+                location=self.get_location(file_id), offset=offset, limit=limit),
+            sleep_threshold=0)
+        if not isinstance(result, raw.types.upload.File):
+            raise FileNotFound(f"Unexpected GetFile result: {type(result).__name__}")
+        return result.bytes
 
+    async def fetch_part(self, file_id: FileId, offset: int, limit: int) -> bytes:
         while True:
             try:
-                async for chunk in self.client.stream_media(message, offset=chunk_offset, limit=chunk_limit):
-                    yield chunk
-                break
+                return await self.request_part(file_id, offset, limit)
             except FloodWait as e:
-                logger.debug(f"FloodWait: stream_file, sleep {e.value}s")
-                await asyncio.sleep(e.value)
+                await self.wait_flood(e, "fetch_part")
+
+    @property
+    def bot_key(self) -> Optional[str]:
+        me = getattr(self.client, 'me', None)
+        return str(me.id) if me else None
+
+    async def get_file_properties(self, message_id: int) -> Tuple[FileId, str, int]:
+        # file_ids are bot specific, so the index keeps one per bot. With a
+        # stored one the stream starts without a get_messages round trip.
+        file_info = await get_indexed_file_info(message_id)
+        if file_info is not None and self.bot_key:
+            encoded = (file_info.get('file_ids') or {}).get(self.bot_key)
+            if encoded and file_info.get('unique_id') and file_info.get('file_size'):
+                try:
+                    return FileId.decode(encoded), file_info['unique_id'], file_info['file_size']
+                except Exception as e:
+                    logger.debug(f"Ignoring undecodable stored file_id for {message_id}: {e}")
+        return await self.refresh_file_properties(message_id)
+
+    async def refresh_file_properties(self, message_id: int) -> Tuple[FileId, str, int]:
+        message = await self.get_message(message_id)
+        file_id = parse_fid(message)
+        if file_id is None:
+            raise FileNotFound(f"Message {message_id} has no downloadable media")
+        encoded = getattr(get_media(message), 'file_id', None)
+        if self.bot_key and encoded:
+            await remember_file_id(message_id, self.bot_key, encoded)
+        return file_id, get_uniqid(message), get_fsize(message)
+
+    def stream_file(self, message_id: int, offset: int = 0, limit: int = 0) -> AsyncGenerator[bytes, None]:
+        return stream_lanes([StreamLane(self, message_id)], message_id, offset, limit)
 
-    def get_file_info_sync(self, message: Message) -> Dict[str, Any]:
+    @staticmethod
+    def get_file_info_sync(message: Message) -> Dict[str, Any]:
         media = message.document or message.video or message.audio or message.photo
         if not media:
             return {"message_id": message.id, "error": "No media"}
+        file_id = parse_fid(message)
+        me = getattr(getattr(message, '_client', None), 'me', None)
         return {
             "message_id": message.id,
             "file_size": getattr(media, 'file_size', 0) or 0,
             "file_name": getattr(media, 'file_name', None),
             "mime_type": getattr(media, 'mime_type', None),
             "unique_id": getattr(media, 'file_unique_id', None),
-            "media_type": type(media).__name__.lower()
+            "media_type": type(media).__name__.lower(),
+            "duration": getattr(media, 'duration', 0) or 0,
+            "dc_id": file_id.dc_id if file_id else None,
+            "file_ids": {str(me.id): media.file_id} if me and getattr(media, 'file_id', None) else {},
+            "date": int(message.date.timestamp()) if message.date else 0
         }
 
     async def get_file_info(self, message_id: int) -> Dict[str, Any]:
+        cached = file_info_cache.get(message_id)
+        if cached is not None:
+            return cached
+        return await self.fetch_file_info(message_id)
+
+    async def fetch_file_info(self, message_id: int) -> Dict[str, Any]:
         try:
             message = await self.get_message(message_id)
-            return self.get_file_info_sync(message)
+            file_info = self.get_file_info_sync(message)
+            file_info_cache.set(message_id, file_info)
+            if "error" not in file_info:
+                # Links made before the index existed are added on first use.
+                await db.add_file(file_info)
+            return file_info
+        except FloodWait:
+            raise
         except Exception as e:
             logger.debug(f"Error getting file info for {message_id}: {e}", exc_info=True)
             return {"message_id": message_id, "error": str(e)}
+
+
+async def get_indexed_file_info(message_id: int) -> Optional[Dict[str, Any]]:
+    file_info = file_info_cache.get(message_id)
+    if file_info is None:
+        file_info = await db.get_file(message_id)
+        if file_info is not None:
+            file_info_cache.set(message_id, file_info)
+    return file_info
+
+
+async def remember_file_id(message_id: int, bot_key: str, encoded: str) -> None:
+    file_info = file_info_cache.get(message_id)
+    if file_info is not None:
+        file_info['file_ids'] = {**(file_info.get('file_ids') or {}), bot_key: encoded}
+    await db.set_file_id(message_id, bot_key, encoded)
+
+
+class StreamLane:
+    # One client taking part in a stream. The file_id is bot specific, so
+    # each lane resolves its own the first time it has to fetch a chunk:
+    # from the index when this bot has one stored, otherwise from a fresh
+    # copy of the message.
+    __slots__ = ('streamer', 'message_id', '_properties')
+
+    def __init__(self, streamer: ByteStreamer, message_id: int) -> None:
+        self.streamer = streamer
+        self.message_id = message_id
+        self._properties: Optional[asyncio.Future] = None
+
+    @property
+    def client_id(self) -> Optional[int]:
+        return self.streamer.client_id
+
+    def failover(self, failed_id: Optional[int] = None) -> bool:
+        # Moves the lane to the best available client other than the
+        # current one. A fetch that failed on a client the lane already
+        # left just retries.
+        old_id = self.client_id
+        if old_id is None:
+            return False
+        if failed_id is not None and failed_id != old_id:
+            return True
+        candidates = [cid for cid in client_scheduler.rank(exclude=(old_id,))
+                      if client_scheduler.available(cid)]
+        if not candidates:
+            return False
+        new_id = candidates[0]
+        self.streamer = get_streamer(new_id)
+        self._properties = None
+        client_scheduler.record_failover(old_id)
+        logger.debug(f"Stream lane for {self.message_id} moved from client {old_id} to {new_id}")
+        return True
+
+    async def get_properties(self) -> Tuple[FileId, str, int]:
+        if self._properties is None:
+            self._set_properties(self.streamer.get_file_properties(self.message_id))
+        return await asyncio.shield(self._properties)
+
+    def _set_properties(self, coro: Awaitable[Tuple[FileId, str, int]]) -> None:
+        self._properties = asyncio.ensure_future(coro)
+        self._properties.add_done_callback(_consume_task_error)
+
+    def refresh_reference(self, stale: Optional[asyncio.Future]) -> None:
+        # Concurrent fetches that hit the same expired reference share one
+        # get_messages call.
+        if self._properties is stale:
+            self._set_properties(self.streamer.refresh_file_properties(self.message_id))
+
+    async def load_chunk(self, unique_id: str, index: int) -> bytes:
+        return await chunk_flights.do((unique_id, index), lambda: self._fetch_chunk(index))
+
+    async def load_part(self, unique_id: str, offset: int, limit: int) -> bytes:
+        return await chunk_flights.do(
+            (unique_id, offset, limit), lambda: self._fetch_part(offset, limit))
+
+    async def _fetch_chunk(self, index: int) -> bytes:
+        chunk = await self._fetch(index * CHUNK_SIZE, CHUNK_SIZE)
+        _, unique_id, file_size = await self.get_properties()
+        store_chunk(unique_id, file_size, index, chunk)
+        return chunk
+
+    async def _fetch_part(self, offset: int, limit: int) -> bytes:
+        return await self._fetch(offset, limit)
+
+    async def _fetch(self, offset: int, limit: int) -> bytes:
+        attempts = 0
+        refreshed = False
+        while True:
+            client_id = self.client_id
+            properties = None
+            try:
+                file_id, _, _ = await self.get_properties()
+                properties = self._properties
+                return await self._fetch_measured(file_id, offset, limit)
+            except FileReferenceExpired:
+                if refreshed:
+                    raise
+                refreshed = True
+                logger.debug(f"File reference expired for {self.message_id}, refreshing")
+                self.refresh_reference(properties)
+            except FloodWait as e:
+                if not self.failover(client_id):
+                    logger.debug(f"FloodWait: no other client for stream lane, sleep {e.value}s")
+                    self._properties = None
+                    await asyncio.sleep(e.value)
+            except Exception as e:
+                attempts += 1
+                if attempts >= len(work_loads) or not self.failover(client_id):
+                    raise
+                logger.debug(f"Retrying fetch at {offset} on client {self.client_id} after: {e}")
+
+    async def _fetch_measured(self, file_id: FileId, offset: int, limit: int) -> bytes:
+        # work_loads counts the upstream fetches each client is serving, so
+        # striped lanes and shared fetches are charged to the client that
+        # actually does the work.
+        client_id = self.client_id
+        if client_id is None:
+            return await self.streamer.fetch_part(file_id, offset, limit)
+        started = client_scheduler.begin(client_id)
+        work_loads[client_id] += 1
+        try:
+            data = await self.streamer.fetch_part(file_id, offset, limit)
+        except (asyncio.CancelledError, FloodWait, FileReferenceExpired):
+            client_scheduler.end(client_id, file_id.dc_id, 0, started)
+            raise
+        except Exception:
+            client_scheduler.end(client_id, file_id.dc_id, 0, started, failed=True)
+            raise
+        finally:
+            work_loads[client_id] -= 1
+        client_scheduler.end(client_id, file_id.dc_id, len(data), started)
+        return data
+
+
+async def get_cached_chunk(unique_id: str, index: int) -> Optional[bytes]:
+    chunk = pinned_cache.get(unique_id, index)
+    if chunk is not None:
+        return chunk
+    if chunk_cache.enabled:
+        chunk = chunk_cache.get((unique_id, index))
+        if chunk is not None:
+            return chunk
+    if disk_cache.enabled:
+        chunk = await disk_cache.read_chunk(unique_id, index)
+        if chunk is not None:
+            chunk_cache.put((unique_id, index), chunk)
+            return chunk
+    return None
+
+
+disk_writes: Set[asyncio.Task] = set()
+
+
+def store_chunk(unique_id: str, file_size: int, index: int, chunk: bytes) -> None:
+    # The disk write is serialized behind the cache's write lock, so it runs
+    # in the background rather than holding up the fetch that waits on it.
+    pinned_cache.put(unique_id, index, chunk)
+    chunk_cache.put((unique_id, index), chunk)
+    if disk_cache.enabled and file_size:
+        task = asyncio.create_task(disk_cache.write_chunk(unique_id, file_size, index, chunk))
+        disk_writes.add(task)
+        task.add_done_callback(disk_writes.discard)
+        task.add_done_callback(_consume_task_error)
+
+
+def _is_cached(unique_id: str, index: int) -> bool:
+    return (pinned_cache.contains(unique_id, index) or chunk_cache.contains((unique_id, index))
+            or disk_cache.has_chunk(unique_id, index))
+
+
+async def prefetch_pinned(message_id: int, file_info: Dict[str, Any],
+                          exclude: Collection[int] = ()) -> None:
+    unique_id = file_info['unique_id']
+    missing = []
+    for index in pinned_cache.pin(unique_id, file_info.get('file_size', 0)):
+        chunk = await get_cached_chunk(unique_id, index)
+        if chunk is not None:
+            pinned_cache.put(unique_id, index, chunk)
+        elif index not in exclude:
+            missing.append(index)
+    if not missing:
+        return
+
+    client_id = client_scheduler.rank(file_info.get('dc_id'))[0]
+    lane = StreamLane(get_streamer(client_id), message_id)
+    await asyncio.gather(*(lane.load_chunk(unique_id, index) for index in missing))
+
+
+async def build_seek_index(message_id: int, file_info: Dict[str, Any]) -> Optional[SeekIndex]:
+    unique_id = file_info['unique_id']
+    file_size = file_info.get('file_size', 0)
+    if not work_loads:
+        return None
+    client_id = client_scheduler.rank(file_info.get('dc_id'))[0]
+    lanes = [StreamLane(get_streamer(client_id), message_id)]
+
+    async def read(offset: int, length: int) -> bytes:
+        length = min(length, file_size - offset)
+        if length <= 0:
+            return b""
+        return b"".join([chunk async for chunk in stream_with_failover(
+            lanes, message_id, offset, length)])
+
+    try:
+        index = await build_index(read, file_size)
+    except SeekIndexError as e:
+        logger.debug(f"No seek index for {message_id}: {e}")
+        index = None
+    seek_index_cache.set(unique_id, index)
+    return index
+
+
+seek_builds: Dict[str, asyncio.Task] = {}
+
+
+def start_seek_index(message_id: int, file_info: Dict[str, Any]) -> Optional[asyncio.Task]:
+    # Returns the running or new build for a file not indexed yet. Builds
+    # that fail upstream are not remembered and are tried again later.
+    unique_id = file_info.get('unique_id')
+    if (not seek_index_cache.enabled or not unique_id or not file_info.get('file_size')
+            or not is_seekable(file_info) or seek_index_cache.contains(unique_id)):
+        return None
+    task = seek_builds.get(unique_id)
+    if task is None:
+        task = seek_builds[unique_id] = asyncio.create_task(
+            build_seek_index(message_id, file_info))
+        task.add_done_callback(lambda t: seek_builds.pop(unique_id, None))
+        task.add_done_callback(_consume_task_error)
+    return task
+
+
+async def get_seek_index(message_id: int, file_info: Dict[str, Any]) -> Optional[SeekIndex]:
+    task = start_seek_index(message_id, file_info)
+    if task is not None:
+        return await asyncio.shield(task)
+    return seek_index_cache.get(file_info.get('unique_id') or '')
+
+
+async def warm_file(message_id: int, exclude: Collection[int] = ()) -> None:
+    # Only video and audio are probed and seeked by players; other files
+    # are left to the regular caches.
+    file_info = await get_indexed_file_info(message_id)
+    if (not file_info or not file_info.get('unique_id') or not work_loads
+            or not is_playable(file_info)):
+        return
+    await prefetch_pinned(message_id, file_info, exclude)
+    # The moov box or Cues usually sit in the chunks just pinned.
+    task = start_seek_index(message_id, file_info)
+    if task is not None:
+        await task
+
+
+warmup_tasks: Dict[int, asyncio.Task] = {}
+
+
+def schedule_warmup(message_id: int, exclude: Collection[int] = ()) -> None:
+    # Pins the head and tail of a file and builds its seek index in the
+    # background, so a player's first probes and seeks are answered without
+    # an upstream fetch. Chunks in `exclude` are being streamed already and
+    # get pinned as they arrive.
+    if not (pinned_cache.enabled or seek_index_cache.enabled) or message_id in warmup_tasks:
+        return
+    task = asyncio.create_task(warm_file(message_id, exclude))
+    warmup_tasks[message_id] = task
+    task.add_done_callback(lambda t: warmup_tasks.pop(message_id, None))
+    task.add_done_callback(_consume_task_error)
+
+
+def _schedule_read_ahead(lanes: List[StreamLane], pending: Dict[int, asyncio.Task],
+                         unique_id: str, index: int, chunk_end: int) -> None:
+    for ahead in range(index, chunk_end):
+        if ahead in pending or _is_cached(unique_id, ahead):
+            continue
+        if not stream_buffer_budget.try_acquire(CHUNK_SIZE):
+            break
+        task = asyncio.create_task(lanes[ahead % len(lanes)].load_chunk(unique_id, ahead))
+        stream_buffer_budget.track(task, CHUNK_SIZE)
+        task.add_done_callback(_consume_task_error)
+        pending[ahead] = task
+
+
+def aligned_part(start: int, end: int, max_size: int = CHUNK_SIZE) -> Tuple[int, int]:
+    # Smallest GetFile window covering [start, end), or the max_size
+    # window holding start when the range does not fit in one.
+    size = MIN_PART_SIZE
+    while size < max_size and start // size != (end - 1) // size:
+        size *= 2
+    return start - start % size, size
+
+
+async def stream_parts(lane: StreamLane, unique_id: str, chunk_start: int,
+                       start: int, end: int, size: int) -> AsyncGenerator[bytes, None]:
+    # Reads [start, end) of one chunk with GetFile windows that start at
+    # `size` and double whenever the position is aligned for it.
+    pos = start
+    while pos < end:
+        part_offset, part_size = aligned_part(pos, end, size)
+        data = await lane.load_part(unique_id, chunk_start + part_offset, part_size)
+        piece = data[pos - part_offset:end - part_offset]
+        if piece:
+            yield piece
+        if len(data) < part_size:
+            break
+        pos = part_offset + part_size
+        if size < CHUNK_SIZE and pos % (size * 2) == 0:
+            size *= 2
+
+
+def boundary_chunks(ranges: List[Tuple[int, int]]) -> Dict[int, Optional[bytes]]:
+    # Chunks holding the end of one of the sorted, disjoint inclusive
+    # `ranges` and the start of the next. A multipart response reads
+    # these whole, once, and keeps them for the following part.
+    return {end // CHUNK_SIZE: None
+            for (_, end), (start, _) in zip(ranges, ranges[1:])
+            if end // CHUNK_SIZE == start // CHUNK_SIZE}
+
+
+async def stream_lanes(lanes: List[StreamLane], message_id: int,
+                       offset: int = 0, limit: int = 0,
+                       pacer: Optional[PlaybackPacer] = None,
+                       shared: Optional[Dict[int, Optional[bytes]]] = None
+                       ) -> AsyncGenerator[bytes, None]:
+    # Yields exactly the bytes [offset, offset + limit). Chunk i is fetched
+    # by lane i % len(lanes); every lane keeps its own READ_AHEAD_CHUNKS
+    # window and chunks are yielded strictly in order. An uncached first
+    # chunk is read with small, growing requests for a fast first byte, and
+    # a partly needed last chunk only fetches the bytes it needs. With a
+    # pacer, chunks not cached yet are fetched only once they fall inside
+    # its playback window. Chunks listed in `shared` are fetched whole and
+    # kept there for the caller's next stream.
+    file_info = file_info_cache.get(message_id)
+    unique_id = file_info.get('unique_id') if file_info else None
+    file_size = file_info.get('file_size', 0) if file_info else 0
+    if not unique_id or not file_size:
+        try:
+            _, unique_id, file_size = await lanes[0].get_properties()
+        except FileNotFound:
+            raise
+        except Exception as e:
+            raise LaneError(lanes[0].client_id, e) from e
+
+    end = min(offset + limit, file_size) if limit > 0 else file_size
+    first_index = index = offset // CHUNK_SIZE
+    chunk_end = (end + CHUNK_SIZE - 1) // CHUNK_SIZE
+    full_end = chunk_end
+    if end % CHUNK_SIZE and end < file_size:
+        full_end -= 1
+    window = max(0, Var.READ_AHEAD_CHUNKS) * len(lanes)
+    pending: Dict[int, asyncio.Task] = {}
+    held = 0
+
+    try:
+        while index < chunk_end:
+            chunk_start = index * CHUNK_SIZE
+            chunk_length = min(CHUNK_SIZE, file_size - chunk_start)
+            lo = max(offset, chunk_start) - chunk_start
+            hi = min(end, chunk_start + CHUNK_SIZE) - chunk_start
+
+            task = pending.pop(index, None)
+            chunk = None
+            if task is not None:
+                held = stream_buffer_budget.adopt(task)
+            else:
+                chunk = shared.get(index) if shared else None
+                if chunk is None:
+                    chunk = await get_cached_chunk(unique_id, index)
+                if chunk is None and pacer is not None:
+                    delay = pacer.delay(chunk_start)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                if chunk is None:
+                    held = await stream_buffer_budget.acquire(chunk_length, wait=not pending)
+                if chunk is None and (first_index < index < full_end or
+                                      (shared and index in shared)):
+                    task = asyncio.create_task(lanes[index % len(lanes)].load_chunk(unique_id, index))
+
+            ahead_end = min(index + 1 + window, full_end)
+            if pacer is not None:
+                allowed = pacer.allowed_end(max(offset, chunk_start))
+                ahead_end = min(ahead_end, (allowed + CHUNK_SIZE - 1) // CHUNK_SIZE)
+            _schedule_read_ahead(lanes, pending, unique_id, index + 1, ahead_end)
+
+            lane = lanes[index % len(lanes)]
+            try:
+                if task is not None:
+                    chunk = await task
+            except FileNotFound:
+                raise
+            except Exception as e:
+                raise LaneError(lane.client_id, e) from e
+
+            if chunk is not None:
+                if shared and index in shared:
+                    # Kept for the next stream if this one ends here,
+                    # otherwise this stream was the second reader.
+                    if index == chunk_end - 1:
+                        shared[index] = chunk
+                    else:
+                        del shared[index]
+                piece = chunk[lo:hi]
+                if piece:
+                    yield piece
+                if len(chunk) < chunk_length:
+                    break
+            else:
+                size = FIRST_PART_SIZE if index == first_index else CHUNK_SIZE
+                parts = [] if lo == 0 and hi == chunk_length else None
+                try:
+                    async for piece in stream_parts(lane, unique_id, chunk_start, lo, hi, size):
+                        if parts is not None:
+                            parts.append(piece)
+                        yield piece
+                except FileNotFound:
+                    raise
+                except Exception as e:
+                    raise LaneError(lane.client_id, e) from e
+                if parts is not None:
+                    chunk = b"".join(parts)
+                    if len(chunk) == chunk_length:
+                        store_chunk(unique_id, file_size, index, chunk)
+            stream_buffer_budget.free(held)
+            held = 0
+            index += 1
+    finally:
+        for task in pending.values():
+            task.cancel()
+            stream_buffer_budget.release(task)
+        stream_buffer_budget.free(held)
+
+
+async def stream_with_failover(lanes: List[StreamLane], message_id: int,
+                               offset: int, limit: int,
+                               pacer: Optional[PlaybackPacer] = None,
+                               shared: Optional[Dict[int, Optional[bytes]]] = None
+                               ) -> AsyncGenerator[bytes, None]:
+    # Restarts stream_lanes at the first byte not yet yielded after an
+    # upstream failure, with the lanes on the failing client moved to
+    # other clients, so the HTTP response carries on instead of ending
+    # short. Lanes on healthy clients stay where they are.
+    position = offset
+    end = offset + limit
+    resumes = 0
+    while position < end:
+        try:
+            async for chunk in stream_lanes(lanes, message_id, position, end - position,
+                                            pacer, shared):
+                yield chunk
+                position += len(chunk)
+            return
+        except LaneError as e:
+            moved = [lane.failover() for lane in lanes if lane.client_id == e.client_id]
+            if resumes >= MAX_STREAM_RESUMES or e.client_id is None or not all(moved):
+                raise e.error from None
+            resumes += 1
+            logger.warning(f"Resuming stream of {message_id} at byte {position} after: {e}")
+
+
+def _consume_task_error(task: asyncio.Future) -> None:
+    if not task.cancelled() and task.exception() is not None:
+        logger.debug(f"Background chunk fetch failed: {task.exception()}")
@@ -17,6 +17,7 @@ class Database:
         self.token_col: AsyncCollection = self.db.tokens
         self.authorized_users_col: AsyncCollection = self.db.authorized_users
         self.restart_message_col: AsyncCollection = self.db.restart_message
+        self.files_col: AsyncCollection = self.db.files
 
     async def ensure_indexes(self):
         try:
@@ -29,6 +30,7 @@ class Database:
             await self.token_col.create_index("activated")
             await self.restart_message_col.create_index("message_id", unique=True)
             await self.restart_message_col.create_index("timestamp", expireAfterSeconds=3600)
+            await self.files_col.create_index("message_id", unique=True)
 
             logger.debug("Database indexes ensured.")
         except Exception as e:
@@ -207,6 +209,39 @@ class Database:
         except Exception as e:
             logger.error(f"Error deleting restart message {message_id}: {e}", exc_info=True)
 
+    async def add_file(self, file_info: Dict[str, Any]) -> None:
+        try:
+            await self.files_col.update_one(
+                {"message_id": file_info["message_id"]},
+                {"$set": {**file_info, "indexed_at": datetime.datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error indexing file {file_info.get('message_id')}: {e}", exc_info=True)
+
+    async def get_file(self, message_id: int) -> Optional[Dict[str, Any]]:
+        try:
+            return await self.files_col.find_one(
+                {"message_id": message_id}, {"_id": 0, "indexed_at": 0})
+        except Exception as e:
+            logger.error(f"Error in get_file for message {message_id}: {e}", exc_info=True)
+            return None
+
+    async def set_file_id(self, message_id: int, bot_key: str, file_id: str) -> None:
+        try:
+            await self.files_col.update_one(
+                {"message_id": message_id},
+                {"$set": {f"file_ids.{bot_key}": file_id}}
+            )
+        except Exception as e:
+            logger.error(f"Error storing file_id for message {message_id}: {e}", exc_info=True)
+
+    async def delete_file(self, message_id: int) -> None:
+        try:
+            await self.files_col.delete_one({"message_id": message_id})
+        except Exception as e:
+            logger.error(f"Error deleting file index {message_id}: {e}", exc_info=True)
+
     async def close(self):
         if self._client:
             await self._client.close()
@@ -0,0 +1,227 @@
+# Thunder/utils/disk_cache.py
+
+import asyncio
+import glob
+import os
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from Thunder.utils.logger import logger
+from Thunder.vars import Var
+
+CHUNK_SIZE = 1024 * 1024
+MAP_HEADER_SIZE = 8
+
+
+class DiskEntry:
+    __slots__ = ('file_size', 'bitmap', 'cached_bytes')
+
+    def __init__(self, file_size: int, bitmap: Optional[bytearray] = None) -> None:
+        self.file_size = file_size
+        self.bitmap = bitmap if bitmap is not None else bytearray((self.chunk_count + 7) // 8)
+        self.cached_bytes = sum(
+            self.chunk_length(i) for i in range(self.chunk_count) if self.has_chunk(i))
+
+    @property
+    def chunk_count(self) -> int:
+        return (self.file_size + CHUNK_SIZE - 1) // CHUNK_SIZE
+
+    def chunk_length(self, index: int) -> int:
+        return min(CHUNK_SIZE, self.file_size - index * CHUNK_SIZE)
+
+    def has_chunk(self, index: int) -> bool:
+        if index < 0 or index >= self.chunk_count:
+            return False
+        return bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+    def mark_chunk(self, index: int) -> None:
+        if not self.has_chunk(index):
+            self.bitmap[index >> 3] |= 1 << (index & 7)
+            self.cached_bytes += self.chunk_length(index)
+
+    def copy(self) -> "DiskEntry":
+        entry = DiskEntry.__new__(DiskEntry)
+        entry.file_size = self.file_size
+        entry.bitmap = bytearray(self.bitmap)
+        entry.cached_bytes = self.cached_bytes
+        return entry
+
+    def serialize(self) -> bytes:
+        return self.file_size.to_bytes(MAP_HEADER_SIZE, 'big') + bytes(self.bitmap)
+
+
+class DiskChunkCache:
+    # Each file is kept as a sparse file of its real size plus a ".map"
+    # bitmap of the 1 MiB chunks already written, so partly watched files
+    # can be resumed from disk after a restart.
+    def __init__(self, root: str, max_bytes: int) -> None:
+        self.root = root
+        self.max_bytes = max(0, max_bytes)
+        self._entries: OrderedDict[str, DiskEntry] = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._write_lock = asyncio.Lock()
+        if self.enabled:
+            self._load()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def data_path(self, unique_id: str) -> str:
+        return os.path.join(self.root, f"{unique_id}.bin")
+
+    def _map_path(self, unique_id: str) -> str:
+        return os.path.join(self.root, f"{unique_id}.map")
+
+    def _load(self) -> None:
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            map_files = sorted(
+                glob.glob(os.path.join(self.root, "*.map")), key=os.path.getmtime)
+        except OSError as e:
+            logger.error(f"Disk cache unavailable at {self.root}: {e}", exc_info=True)
+            self.max_bytes = 0
+            return
+
+        for map_file in map_files:
+            unique_id = os.path.basename(map_file)[:-len(".map")]
+            try:
+                with open(map_file, 'rb') as f:
+                    raw = f.read()
+                file_size = int.from_bytes(raw[:MAP_HEADER_SIZE], 'big')
+                entry = DiskEntry(file_size, bytearray(raw[MAP_HEADER_SIZE:]))
+                if len(entry.bitmap) != (entry.chunk_count + 7) // 8:
+                    raise ValueError("bitmap size mismatch")
+                if not os.path.exists(self.data_path(unique_id)):
+                    raise FileNotFoundError(self.data_path(unique_id))
+            except (OSError, ValueError) as e:
+                logger.debug(f"Dropping disk cache entry {unique_id}: {e}")
+                self._remove_files(unique_id)
+                continue
+            self._entries[unique_id] = entry
+            self.total_bytes += entry.cached_bytes
+
+        self._evict()
+        logger.debug(
+            f"Disk cache loaded: {len(self._entries)} files, {self.total_bytes} bytes")
+
+    def _remove_files(self, unique_id: str) -> None:
+        for path in (self.data_path(unique_id), self._map_path(unique_id)):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.debug(f"Error removing disk cache file {path}: {e}")
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self.total_bytes > self.max_bytes and self._entries:
+            unique_id = next(iter(self._entries))
+            if unique_id == keep:
+                if len(self._entries) == 1:
+                    break
+                self._entries.move_to_end(unique_id)
+                continue
+            entry = self._entries.pop(unique_id)
+            self.total_bytes -= entry.cached_bytes
+            self._remove_files(unique_id)
+            self.evictions += 1
+
+    def has_chunk(self, unique_id: str, index: int) -> bool:
+        entry = self._entries.get(unique_id)
+        return entry is not None and entry.has_chunk(index)
+
+    def has_range(self, unique_id: str, start: int, end: int) -> bool:
+        entry = self._entries.get(unique_id)
+        if entry is None or end >= entry.file_size:
+            return False
+        if all(entry.has_chunk(i) for i in range(start // CHUNK_SIZE, end // CHUNK_SIZE + 1)):
+            self._entries.move_to_end(unique_id)
+            self.hits += 1
+            return True
+        return False
+
+    @staticmethod
+    def _read_sync(path: str, offset: int, length: int) -> bytes:
+        with open(path, 'rb') as f:
+            return os.pread(f.fileno(), length, offset)
+
+    @staticmethod
+    def _write_sync(path: str, map_path: str, file_size: int, offset: int, data: bytes, map_data: bytes) -> None:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if os.fstat(fd).st_size != file_size:
+                os.ftruncate(fd, file_size)
+            os.pwrite(fd, data, offset)
+        finally:
+            os.close(fd)
+        tmp_path = f"{map_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(map_data)
+        os.replace(tmp_path, map_path)
+
+    async def read_chunk(self, unique_id: str, index: int) -> Optional[bytes]:
+        entry = self._entries.get(unique_id)
+        if entry is None or not entry.has_chunk(index):
+            self.misses += 1
+            return None
+        self._entries.move_to_end(unique_id)
+        length = entry.chunk_length(index)
+        try:
+            data = await asyncio.to_thread(
+                self._read_sync, self.data_path(unique_id), index * CHUNK_SIZE, length)
+        except OSError as e:
+            logger.debug(f"Disk cache read failed for {unique_id}:{index}: {e}")
+            self.misses += 1
+            return None
+        if len(data) != length:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    async def write_chunk(self, unique_id: str, file_size: int, index: int, data: bytes) -> None:
+        if not self.enabled or file_size <= 0:
+            return
+        async with self._write_lock:
+            entry = self._entries.get(unique_id)
+            if entry is not None and (entry.file_size != file_size or entry.has_chunk(index)):
+                return
+            updated = entry.copy() if entry else DiskEntry(file_size)
+            if index >= updated.chunk_count or len(data) != updated.chunk_length(index):
+                return
+            if len(data) > self.max_bytes:
+                return
+            updated.mark_chunk(index)
+
+            try:
+                await asyncio.to_thread(
+                    self._write_sync, self.data_path(unique_id), self._map_path(unique_id),
+                    file_size, index * CHUNK_SIZE, data, updated.serialize())
+            except OSError as e:
+                logger.debug(f"Disk cache write failed for {unique_id}:{index}: {e}")
+                return
+
+            self.total_bytes += updated.cached_bytes - (entry.cached_bytes if entry else 0)
+            self._entries[unique_id] = updated
+            self._entries.move_to_end(unique_id)
+            self._evict(keep=unique_id)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "max_bytes": self.max_bytes,
+            "resident_bytes": self.total_bytes,
+            "files": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+disk_cache = DiskChunkCache(Var.DISK_CACHE_DIR, Var.DISK_CACHE_SIZE_MB * 1024 * 1024)
@@ -0,0 +1,244 @@
+# Thunder/utils/download_pool.py
+
+import asyncio
+import itertools
+import multiprocessing
+import time
+from collections import deque
+from multiprocessing import shared_memory
+from typing import Any, Deque, Dict, List, Tuple
+
+from pyrogram.errors import FileReferenceExpired, FloodWait
+from pyrogram.file_id import FileId
+
+from Thunder.server.exceptions import FileNotFound
+from Thunder.utils.logger import logger
+from Thunder.vars import Var
+
+SLOT_SIZE = 1024 * 1024
+THROUGHPUT_WINDOW = 10.0
+STOP_TIMEOUT = 10
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 60.0
+
+
+class DownloadWorkerError(Exception):
+    # The pool could not run the request: no worker ready, or the worker
+    # died. Says nothing about the Telegram client.
+    pass
+
+
+class DownloadPartError(Exception):
+    # GetFile failed inside the worker.
+    pass
+
+
+class DownloadWorker:
+    __slots__ = ('index', 'process', 'conn', 'free_slots', 'pending', 'ready',
+                 'alive', 'requests', 'bytes_total', 'errors', 'transfers')
+
+    def __init__(self, index: int, process: Any, conn: Any, slots: int) -> None:
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.free_slots: asyncio.Queue = asyncio.Queue()
+        for slot in range(slots):
+            self.free_slots.put_nowait(slot)
+        self.pending: Dict[int, Tuple[asyncio.Future, int]] = {}
+        self.ready = False
+        self.alive = True
+        self.requests = 0
+        self.bytes_total = 0
+        self.errors = 0
+        self.transfers: Deque[Tuple[float, int]] = deque()
+
+    def bytes_per_sec(self, now: float) -> float:
+        while self.transfers and now - self.transfers[0][0] > THROUGHPUT_WINDOW:
+            self.transfers.popleft()
+        return sum(n for _, n in self.transfers) / THROUGHPUT_WINDOW
+
+
+class DownloadWorkerPool:
+    # GetFile round trips, and the MTProto decryption behind them, run in
+    # separate processes that each log in their own clients. A worker
+    # writes the decrypted part into a slot of its shared-memory ring and
+    # replies over a pipe; the event loop here only copies the slot out.
+    def __init__(self, count: int, slots: int) -> None:
+        self.count = max(0, count)
+        self.slots = max(1, slots)
+        self.context = multiprocessing.get_context("spawn")
+        self._workers: List[DownloadWorker] = []
+        self._memory: Dict[int, shared_memory.SharedMemory] = {}
+        self._ids = itertools.count(1)
+        self._stopping = False
+        self._sessions: Dict[int, str] = {}
+        self._crashes: Dict[int, int] = {}
+        self._restart_timers: Dict[int, asyncio.TimerHandle] = {}
+        self.restarts = 0
+
+    @property
+    def enabled(self) -> bool:
+        return any(worker.ready for worker in self._workers)
+
+    def start(self, sessions: Dict[int, str]) -> None:
+        # Workers resume these client sessions rather than signing in.
+        if not self.count or self._workers:
+            return
+        self._sessions = sessions
+        self._stopping = False
+        for index in range(self.count):
+            self._workers.append(self._spawn(index))
+
+    def _spawn(self, index: int) -> DownloadWorker:
+        from Thunder.workers import run_download_worker
+
+        shm = self._memory.get(index)
+        if shm is None:
+            shm = self._memory[index] = shared_memory.SharedMemory(
+                create=True, size=self.slots * SLOT_SIZE)
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(
+            target=run_download_worker,
+            args=(index, child_conn, shm.name, SLOT_SIZE, self._sessions),
+            name=f"download-worker-{index}",
+            daemon=True)
+        process.start()
+        child_conn.close()
+        worker = DownloadWorker(index, process, parent_conn, self.slots)
+        asyncio.get_running_loop().add_reader(
+            parent_conn.fileno(), self._on_response, worker)
+        return worker
+
+    def _on_response(self, worker: DownloadWorker) -> None:
+        try:
+            while worker.conn.poll():
+                request_id, kind, payload = worker.conn.recv()
+                if kind == "ready":
+                    worker.ready = True
+                    continue
+                future, slot = worker.pending.pop(request_id)
+                if kind == "ok":
+                    start = slot * SLOT_SIZE
+                    payload = bytes(self._memory[worker.index].buf[start:start + payload])
+                    worker.requests += 1
+                    worker.bytes_total += len(payload)
+                    worker.transfers.append((time.monotonic(), len(payload)))
+                else:
+                    worker.errors += 1
+                worker.free_slots.put_nowait(slot)
+                if not future.done():
+                    future.set_result((kind, payload))
+        except (EOFError, OSError):
+            self._on_exit(worker)
+
+    def _on_exit(self, worker: DownloadWorker) -> None:
+        started = worker.ready
+        worker.alive = False
+        worker.ready = False
+        asyncio.get_running_loop().remove_reader(worker.conn.fileno())
+        worker.conn.close()
+        # Waiters blocked on a slot wake up, see the worker is gone and
+        # fail over like any other upstream error.
+        for future, slot in worker.pending.values():
+            worker.free_slots.put_nowait(slot)
+            if not future.done():
+                future.set_result(("exited", "download worker exited"))
+        worker.pending.clear()
+        if self._stopping:
+            return
+        # A worker that dies before it is ready (bad session, network down)
+        # is restarted with a doubling delay instead of in a tight loop.
+        crashes = 0 if started else self._crashes.get(worker.index, 0) + 1
+        self._crashes[worker.index] = crashes
+        delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** crashes)
+        logger.warning(
+            f"Download worker {worker.index} exited with code {worker.process.exitcode}, "
+            f"restarting in {delay:.0f}s")
+        self._restart_timers[worker.index] = asyncio.get_running_loop().call_later(
+            delay, self._restart, worker)
+
+    def _restart(self, worker: DownloadWorker) -> None:
+        self._restart_timers.pop(worker.index, None)
+        if self._stopping or worker not in self._workers:
+            return
+        self.restarts += 1
+        self._workers[self._workers.index(worker)] = self._spawn(worker.index)
+
+    async def fetch(self, client_id: int, file_id: FileId, offset: int, limit: int) -> bytes:
+        ready = [worker for worker in self._workers if worker.ready]
+        if not ready:
+            raise DownloadWorkerError("No download worker available")
+        worker = min(ready, key=lambda w: len(w.pending))
+        slot = await worker.free_slots.get()
+        if not worker.alive:
+            worker.free_slots.put_nowait(slot)
+            raise DownloadWorkerError("Download worker exited")
+
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        worker.pending[request_id] = (future, slot)
+        try:
+            worker.conn.send((request_id, client_id, file_id.encode(), offset, limit, slot))
+        except OSError as e:
+            worker.pending.pop(request_id, None)
+            worker.free_slots.put_nowait(slot)
+            raise DownloadWorkerError(f"Download worker unreachable: {e}") from e
+
+        # If this request is cancelled, the slot stays reserved until the
+        # worker answers, so a late write cannot land in a reused slot.
+        kind, payload = await future
+        if kind == "ok":
+            return payload
+        if kind == "flood":
+            raise FloodWait(value=payload)
+        if kind == "reference_expired":
+            raise FileReferenceExpired()
+        if kind == "not_found":
+            raise FileNotFound(payload)
+        if kind == "exited":
+            raise DownloadWorkerError(payload)
+        raise DownloadPartError(payload)
+
+    async def stop(self) -> None:
+        self._stopping = True
+        for timer in self._restart_timers.values():
+            timer.cancel()
+        self._restart_timers.clear()
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            if worker.process.is_alive():
+                worker.process.terminate()
+        for worker in workers:
+            await asyncio.to_thread(worker.process.join, STOP_TIMEOUT)
+            if worker.process.is_alive():
+                worker.process.kill()
+            if worker.alive:
+                self._on_exit(worker)
+        for shm in self._memory.values():
+            shm.close()
+            shm.unlink()
+        self._memory.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "workers": self.count,
+            "slots": self.slots,
+            "restarts": self.restarts,
+            "per_worker": {
+                str(worker.index): {
+                    "ready": worker.ready,
+                    "pid": worker.process.pid,
+                    "in_flight": len(worker.pending),
+                    "free_slots": worker.free_slots.qsize(),
+                    "requests": worker.requests,
+                    "errors": worker.errors,
+                    "bytes_total": worker.bytes_total,
+                    "bytes_per_sec": round(worker.bytes_per_sec(now))
+                }
+                for worker in self._workers
+            }
+        }
+
+
+download_pool = DownloadWorkerPool(Var.DOWNLOAD_WORKERS, Var.DOWNLOAD_WORKER_SLOTS)
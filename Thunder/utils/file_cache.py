@@ -0,0 +1,63 @@
+# Thunder/utils/file_cache.py
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from Thunder.vars import Var
+
+
+class FileInfoCache:
+    __slots__ = ('max_entries', 'ttl', '_entries', 'hits', 'misses', 'evictions')
+
+    def __init__(self, max_entries: int, ttl: float) -> None:
+        self.max_entries = max(0, max_entries)
+        self.ttl = ttl
+        self._entries: OrderedDict[int, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, message_id: int) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(message_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, info = entry
+        if expires_at <= time.monotonic():
+            del self._entries[message_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(message_id)
+        self.hits += 1
+        return info
+
+    def set(self, message_id: int, info: Dict[str, Any]) -> None:
+        if not self.max_entries or info.get('error'):
+            return
+        self._entries[message_id] = (time.monotonic() + self.ttl, info)
+        self._entries.move_to_end(message_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, message_id: int) -> bool:
+        return self._entries.pop(message_id, None) is not None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+file_info_cache = FileInfoCache(Var.FILE_INFO_CACHE_SIZE, Var.FILE_INFO_CACHE_TTL)
@@ -0,0 +1,217 @@
+# Thunder/utils/media_sessions.py
+
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from pyrogram import Client, raw
+from pyrogram.errors import AuthBytesInvalid
+from pyrogram.session import Auth, Session
+
+from Thunder.bot import multi_clients
+from Thunder.utils.logger import logger
+from Thunder.vars import Var
+
+STORED_SESSION_TIMEOUT = 15
+PING_TIMEOUT = 10
+
+
+class MediaSessionPool:
+    # One media Session per client and DC. Keys authorized through an auth
+    # export are persisted, so after a restart the session is rebuilt
+    # without a new key exchange or another export/import round trip.
+    def __init__(self, store_path: str, keepalive_interval: int) -> None:
+        self.store_path = store_path
+        self.keepalive_interval = keepalive_interval
+        self.known_dcs: Set[int] = set(Var.MEDIA_SESSION_DCS)
+        self._keys: Dict[str, Dict[str, str]] = {}
+        self._states: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        self._locks: Dict[Tuple[str, int], asyncio.Lock] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not self.store_path or not os.path.exists(self.store_path):
+            return
+        try:
+            with open(self.store_path, 'r') as f:
+                data = json.load(f)
+            self.known_dcs.update(int(dc) for dc in data.get("dcs", []))
+            self._keys = {str(k): dict(v) for k, v in data.get("keys", {}).items()}
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            logger.warning(f"Ignoring unreadable media session store {self.store_path}: {e}")
+
+    def _save(self) -> None:
+        # The store holds exported auth keys, i.e. full access to the bots.
+        # Every process writes through its own 0600 temp file and replaces
+        # the store atomically, so concurrent saves cannot interleave.
+        if not self.store_path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.store_path))
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix=f"{os.path.basename(self.store_path)}.", suffix=".tmp", dir=directory)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({"dcs": sorted(self.known_dcs), "keys": self._keys}, f)
+            os.replace(tmp_path, self.store_path)
+        except OSError as e:
+            logger.error(f"Error saving media session store: {e}", exc_info=True)
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _state(self, client: Client, dc_id: int) -> Dict[str, Any]:
+        return self._states.setdefault((client.name, dc_id), {
+            "state": "idle",
+            "auth": None,
+            "since": None,
+            "uses": 0,
+            "failures": 0
+        })
+
+    async def get(self, client: Client, dc_id: int) -> Session:
+        media_session = client.media_sessions.get(dc_id)
+        if media_session is None:
+            lock = self._locks.setdefault((client.name, dc_id), asyncio.Lock())
+            async with lock:
+                media_session = client.media_sessions.get(dc_id)
+                if media_session is None:
+                    media_session = await self._open(client, dc_id)
+        self._state(client, dc_id)["uses"] += 1
+        return media_session
+
+    async def _open(self, client: Client, dc_id: int) -> Session:
+        state = self._state(client, dc_id)
+        state["state"] = "connecting"
+        try:
+            media_session, auth = await self._create(client, dc_id)
+        except Exception:
+            state["state"] = "failed"
+            state["failures"] += 1
+            raise
+
+        client.media_sessions[dc_id] = media_session
+        state.update(state="ready", auth=auth, since=int(time.time()))
+        if dc_id not in self.known_dcs:
+            self.known_dcs.add(dc_id)
+            self._save()
+        return media_session
+
+    async def _create(self, client: Client, dc_id: int) -> Tuple[Session, str]:
+        test_mode = await client.storage.test_mode()
+        if dc_id == await client.storage.dc_id():
+            media_session = Session(
+                client, dc_id, await client.storage.auth_key(),
+                test_mode, is_media=True)
+            await media_session.start()
+            return media_session, "home"
+
+        owner = str(await client.storage.user_id())
+        stored_key = self._keys.get(owner, {}).get(str(dc_id))
+        if stored_key:
+            media_session = await self._resume(client, dc_id, bytes.fromhex(stored_key), test_mode)
+            if media_session is not None:
+                return media_session, "stored"
+            self._keys.get(owner, {}).pop(str(dc_id), None)
+            self._save()
+
+        auth_key = await Auth(client, dc_id, test_mode).create()
+        media_session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+        await media_session.start()
+        for _ in range(6):
+            exported_auth = await client.invoke(
+                raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+            try:
+                await media_session.invoke(
+                    raw.functions.auth.ImportAuthorization(
+                        id=exported_auth.id, bytes=exported_auth.bytes))
+                break
+            except AuthBytesInvalid:
+                logger.debug(f"Invalid authorization bytes for DC {dc_id}, retrying")
+                continue
+        else:
+            await media_session.stop()
+            raise AuthBytesInvalid
+
+        self._keys.setdefault(owner, {})[str(dc_id)] = auth_key.hex()
+        self._save()
+        return media_session, "exported"
+
+    async def _resume(self, client: Client, dc_id: int, auth_key: bytes,
+                      test_mode: bool) -> Optional[Session]:
+        media_session = Session(client, dc_id, auth_key, test_mode, is_media=True)
+        try:
+            await asyncio.wait_for(media_session.start(), STORED_SESSION_TIMEOUT)
+            await media_session.invoke(
+                raw.functions.users.GetUsers(id=[raw.types.InputUserSelf()]),
+                retries=0, timeout=PING_TIMEOUT)
+            return media_session
+        except Exception as e:
+            logger.debug(f"Stored media session for DC {dc_id} rejected: {e}")
+            await self._close(media_session)
+            return None
+
+    @staticmethod
+    async def _close(media_session: Session) -> None:
+        try:
+            await media_session.stop()
+        except Exception as e:
+            logger.debug(f"Error stopping media session: {e}")
+
+    async def prewarm(self) -> None:
+        tasks = [
+            self.get(client, dc_id)
+            for client in list(multi_clients.values())
+            for dc_id in sorted(self.known_dcs)
+            if dc_id not in client.media_sessions
+        ]
+        if not tasks:
+            return
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.debug(f"Media session pre-warm failed: {result}")
+
+    async def check(self) -> None:
+        for client in list(multi_clients.values()):
+            for dc_id, media_session in list(client.media_sessions.items()):
+                try:
+                    await media_session.invoke(
+                        raw.functions.Ping(ping_id=0), retries=0, timeout=PING_TIMEOUT)
+                except Exception as e:
+                    logger.debug(f"Media session {client.name}/DC {dc_id} failed keepalive: {e}")
+                    if client.media_sessions.get(dc_id) is media_session:
+                        del client.media_sessions[dc_id]
+                    state = self._state(client, dc_id)
+                    state["state"] = "reconnecting"
+                    state["failures"] += 1
+                    await self._close(media_session)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.prewarm()
+                if self.keepalive_interval <= 0:
+                    break
+                await asyncio.sleep(self.keepalive_interval)
+                await self.check()
+            except asyncio.CancelledError:
+                logger.debug("Media session keepalive cancelled cleanly.")
+                break
+            except Exception as e:
+                logger.error(f"Media session keepalive error: {e}", exc_info=True)
+
+    def stats(self) -> Dict[str, Any]:
+        names = {client.name: str(cid) for cid, client in multi_clients.items()}
+        clients: Dict[str, Dict[str, Any]] = {}
+        for (name, dc_id), state in sorted(self._states.items()):
+            clients.setdefault(names.get(name, name), {})[str(dc_id)] = dict(state)
+        return {
+            "known_dcs": sorted(self.known_dcs),
+            "clients": clients
+        }
+
+
+media_session_pool = MediaSessionPool(Var.MEDIA_SESSION_STORE, Var.MEDIA_SESSION_KEEPALIVE)
@@ -0,0 +1,116 @@
+# Thunder/utils/pinned_cache.py
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from Thunder.vars import Var
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class PinnedEntry:
+    __slots__ = ('file_size', 'chunks', 'resident_bytes')
+
+    def __init__(self, file_size: int) -> None:
+        self.file_size = file_size
+        self.chunks: Dict[int, bytes] = {}
+        self.resident_bytes = 0
+
+
+class PinnedCache:
+    # Keeps the chunks holding the first and last bytes of recently linked
+    # or watched files, which players read before starting playback (MP4
+    # moov, MKV cues). It is separate from the chunk caches so sequential
+    # traffic cannot push them out; whole files are evicted LRU first.
+    def __init__(self, max_bytes: int, head_bytes: int, tail_bytes: int) -> None:
+        self.max_bytes = max(0, max_bytes)
+        self.head_bytes = max(0, head_bytes)
+        self.tail_bytes = max(0, tail_bytes)
+        self._entries: OrderedDict[str, PinnedEntry] = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and (self.head_bytes > 0 or self.tail_bytes > 0)
+
+    def pinned_indexes(self, file_size: int) -> List[int]:
+        chunk_count = (file_size + CHUNK_SIZE - 1) // CHUNK_SIZE
+        head_end = min(chunk_count, (self.head_bytes + CHUNK_SIZE - 1) // CHUNK_SIZE)
+        tail_start = max(0, file_size - self.tail_bytes) // CHUNK_SIZE if self.tail_bytes else chunk_count
+        return sorted(set(range(head_end)) | set(range(tail_start, chunk_count)))
+
+    def pin(self, unique_id: str, file_size: int) -> List[int]:
+        # Registers the file as most recently used and returns the pinned
+        # chunks it still needs.
+        if not self.enabled or file_size <= 0:
+            return []
+        entry = self._entries.get(unique_id)
+        if entry is None or entry.file_size != file_size:
+            if entry is not None:
+                self.resident_bytes -= entry.resident_bytes
+            entry = self._entries[unique_id] = PinnedEntry(file_size)
+        self._entries.move_to_end(unique_id)
+        return [index for index in self.pinned_indexes(file_size) if index not in entry.chunks]
+
+    def contains(self, unique_id: str, index: int) -> bool:
+        entry = self._entries.get(unique_id)
+        return entry is not None and index in entry.chunks
+
+    def get(self, unique_id: str, index: int) -> Optional[bytes]:
+        entry = self._entries.get(unique_id)
+        if entry is None:
+            return None
+        data = entry.chunks.get(index)
+        if data is None:
+            if index in self.pinned_indexes(entry.file_size):
+                self.misses += 1
+            return None
+        self._entries.move_to_end(unique_id)
+        self.hits += 1
+        return data
+
+    def put(self, unique_id: str, index: int, data: bytes) -> None:
+        entry = self._entries.get(unique_id)
+        if entry is None or not data or index in entry.chunks:
+            return
+        if index not in self.pinned_indexes(entry.file_size):
+            return
+        entry.chunks[index] = data
+        entry.resident_bytes += len(data)
+        self.resident_bytes += len(data)
+        self._evict(unique_id)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.resident_bytes = 0
+
+    def _evict(self, keep: str) -> None:
+        while self.resident_bytes > self.max_bytes and len(self._entries) > 1:
+            unique_id = next(iter(self._entries))
+            if unique_id == keep:
+                self._entries.move_to_end(unique_id)
+                continue
+            entry = self._entries.pop(unique_id)
+            self.resident_bytes -= entry.resident_bytes
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "max_bytes": self.max_bytes,
+            "resident_bytes": self.resident_bytes,
+            "head_bytes": self.head_bytes,
+            "tail_bytes": self.tail_bytes,
+            "files": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+pinned_cache = PinnedCache(
+    Var.PINNED_CACHE_SIZE_MB * 1024 * 1024, Var.PIN_HEAD_KB * 1024, Var.PIN_TAIL_KB * 1024)
@@ -9,6 +9,9 @@ from pyrogram.errors import FloodWait
 
 from Thunder.bot import StreamBot
 from Thunder.server.exceptions import InvalidHash
+from Thunder.utils.custom_dl import ByteStreamer, get_indexed_file_info, schedule_warmup
+from Thunder.utils.database import db
+from Thunder.utils.file_cache import file_info_cache
 from Thunder.utils.file_properties import get_fname, get_uniqid
 from Thunder.utils.logger import logger
 from Thunder.vars import Var
@@ -23,20 +26,32 @@ template_env = Environment(
 
 async def render_page(id: int, secure_hash: str, requested_action: str | None = None) -> str:
     try:
-        try:
-            message = await StreamBot.get_messages(chat_id=int(Var.BIN_CHANNEL), message_ids=id)
-        except FloodWait as e:
-            await asyncio.sleep(e.value)
-            message = await StreamBot.get_messages(chat_id=int(Var.BIN_CHANNEL), message_ids=id)
-        
-        if not message:
-            raise InvalidHash("Message not found")
-        
-        file_unique_id = get_uniqid(message)
-        file_name = get_fname(message)
-        
+        file_info = await get_indexed_file_info(id)
+        if file_info is not None:
+            file_unique_id = file_info.get('unique_id')
+            file_name = file_info.get('file_name') or f"file_{id}"
+        else:
+            try:
+                message = await StreamBot.get_messages(chat_id=int(Var.BIN_CHANNEL), message_ids=id)
+            except FloodWait as e:
+                await asyncio.sleep(e.value)
+                message = await StreamBot.get_messages(chat_id=int(Var.BIN_CHANNEL), message_ids=id)
+
+            if not message:
+                raise InvalidHash("Message not found")
+
+            file_unique_id = get_uniqid(message)
+            file_name = get_fname(message)
+            if message.media:
+                file_info = ByteStreamer.get_file_info_sync(message)
+                file_info_cache.set(id, file_info)
+                if "error" not in file_info:
+                    await db.add_file(file_info)
+
         if not file_unique_id or file_unique_id[:6] != secure_hash:
             raise InvalidHash("File unique ID or secure hash mismatch during rendering.")
+        if requested_action == 'stream':
+            schedule_warmup(id)
         
         quoted_filename = urllib.parse.quote(file_name.replace('/', '_'))
         src = urllib.parse.urljoin(Var.URL, f'{secure_hash}{id}/{quoted_filename}')
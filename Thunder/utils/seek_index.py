@@ -0,0 +1,478 @@
+# Thunder/utils/seek_index.py
+
+import asyncio
+import bisect
+import struct
+from array import array
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from Thunder.vars import Var
+
+Reader = Callable[[int, int], Awaitable[bytes]]
+
+MP4 = "mp4"
+MKV = "mkv"
+# Upper bound on the moov / Cues data read to build one index.
+MAX_INDEX_BYTES = 32 * 1024 * 1024
+MAX_TOP_LEVEL_ELEMENTS = 64
+MKV_HEAD_BYTES = 64 * 1024
+# Files without sync sample tables mark every frame as a keyframe; those
+# are thinned to one point per this many seconds.
+MIN_POINT_SPACING = 1.0
+
+SEEKABLE_EXTENSIONS = (".mp4", ".m4v", ".mov", ".mkv", ".webm")
+
+EBML_HEADER = 0x1A45DFA3
+MKV_SEGMENT = 0x18538067
+MKV_SEEK_HEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEK_ID = 0x53AB
+MKV_SEEK_POSITION = 0x53AC
+MKV_INFO = 0x1549A966
+MKV_TIMECODE_SCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACK_ENTRY = 0xAE
+MKV_TRACK_NUMBER = 0xD7
+MKV_TRACK_TYPE = 0x83
+MKV_CUES = 0x1C53BB6B
+MKV_CUE_POINT = 0xBB
+MKV_CUE_TIME = 0xB3
+MKV_CUE_TRACK_POSITIONS = 0xB7
+MKV_CUE_TRACK = 0xF7
+MKV_CUE_CLUSTER_POSITION = 0xF1
+MKV_VIDEO_TRACK = 1
+
+
+class SeekIndexError(Exception):
+    pass
+
+
+class SeekIndex:
+    # Keyframe times in seconds and the byte offsets they start at, kept in
+    # two flat arrays so a long film costs a few tens of KB.
+    __slots__ = ('container', 'duration', 'times', 'offsets')
+
+    def __init__(self, container: str, duration: float, points: List[Tuple[float, int]]) -> None:
+        if not points:
+            raise SeekIndexError("No keyframes found")
+        points.sort()
+        self.container = container
+        self.duration = duration
+        self.times = array('d', (time for time, _ in points))
+        self.offsets = array('q', (offset for _, offset in points))
+
+    def lookup(self, seconds: float) -> Tuple[float, int]:
+        # The last keyframe at or before `seconds`.
+        index = max(0, bisect.bisect_right(self.times, seconds) - 1)
+        return self.times[index], self.offsets[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "container": self.container,
+            "duration": round(self.duration, 3),
+            "keyframes": len(self.times),
+            "points": [[round(time, 3), offset] for time, offset in zip(self.times, self.offsets)]
+        }
+
+
+def is_seekable(file_info: Dict[str, Any]) -> bool:
+    mime_type = file_info.get('mime_type') or ''
+    file_name = (file_info.get('file_name') or '').lower()
+    return mime_type.startswith('video/') or file_name.endswith(SEEKABLE_EXTENSIONS)
+
+
+def detect_container(head: bytes) -> Optional[str]:
+    if head[4:8] == b"ftyp":
+        return MP4
+    if head[:4] == EBML_HEADER.to_bytes(4, 'big'):
+        return MKV
+    return None
+
+
+async def build_index(read: Reader, file_size: int) -> SeekIndex:
+    container = detect_container(await read(0, 12))
+    try:
+        if container == MP4:
+            return await build_mp4_index(read, file_size)
+        if container == MKV:
+            return await build_mkv_index(read, file_size)
+    except (struct.error, IndexError, KeyError, ValueError) as e:
+        raise SeekIndexError(f"Malformed {container} file: {e}") from e
+    raise SeekIndexError("Not an MP4 or Matroska file")
+
+
+# MP4
+
+def iter_boxes(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[bytes, int, int]]:
+    # Yields (type, payload_start, payload_end) for the boxes in data[start:end].
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, pos)
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                break
+            size = struct.unpack_from(">Q", data, pos + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            break
+        yield box_type, pos + header, pos + size
+        pos += size
+
+
+def find_box(data: bytes, start: int, end: int, box_type: bytes) -> Optional[Tuple[int, int]]:
+    for found, payload_start, payload_end in iter_boxes(data, start, end):
+        if found == box_type:
+            return payload_start, payload_end
+    return None
+
+
+async def find_moov(read: Reader, file_size: int) -> Tuple[int, int]:
+    pos = 0
+    for _ in range(MAX_TOP_LEVEL_ELEMENTS):
+        if pos + 8 > file_size:
+            break
+        header = await read(pos, 16)
+        if len(header) < 8:
+            break
+        size, box_type = struct.unpack_from(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack_from(">Q", header, 8)[0]
+            header_size = 16
+        elif size == 0:
+            size = file_size - pos
+        if size < header_size:
+            break
+        if box_type == b"moov":
+            return pos + header_size, size - header_size
+        pos += size
+    raise SeekIndexError("No moov box found")
+
+
+def parse_full_box_table(data: bytes, start: int, fmt: str) -> List[Tuple[int, ...]]:
+    count = struct.unpack_from(">I", data, start + 4)[0]
+    item = struct.calcsize(fmt)
+    return [struct.unpack_from(fmt, data, start + 8 + i * item) for i in range(count)]
+
+
+def parse_mdhd(data: bytes, start: int) -> Tuple[int, int]:
+    if data[start] == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, start + 20)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, start + 12)
+    return timescale, duration
+
+
+def mp4_video_table(moov: bytes) -> Dict[bytes, Tuple[int, int]]:
+    for box_type, trak_start, trak_end in iter_boxes(moov):
+        if box_type != b"trak":
+            continue
+        mdia = find_box(moov, trak_start, trak_end, b"mdia")
+        if mdia is None:
+            continue
+        hdlr = find_box(moov, *mdia, b"hdlr")
+        if hdlr is None or moov[hdlr[0] + 8:hdlr[0] + 12] != b"vide":
+            continue
+        mdhd = find_box(moov, *mdia, b"mdhd")
+        minf = find_box(moov, *mdia, b"minf")
+        stbl = find_box(moov, *minf, b"stbl") if minf else None
+        if mdhd is None or stbl is None:
+            continue
+        # Box types stay raw bytes; a corrupt file may hold anything there.
+        table = {box: (start, end) for box, start, end in iter_boxes(moov, *stbl)}
+        table[b"mdhd"] = mdhd
+        return table
+    raise SeekIndexError("No video track found")
+
+
+def parse_mp4_index(moov: bytes) -> SeekIndex:
+    table = mp4_video_table(moov)
+    timescale, duration = parse_mdhd(moov, table[b"mdhd"][0])
+    if not timescale or b"stts" not in table or b"stsz" not in table or b"stsc" not in table:
+        raise SeekIndexError("Video track has no sample tables (fragmented MP4?)")
+
+    stts = parse_full_box_table(moov, table[b"stts"][0], ">II")
+    stsc = parse_full_box_table(moov, table[b"stsc"][0], ">III")
+    if b"co64" in table:
+        chunk_offsets = [offset for offset, in parse_full_box_table(moov, table[b"co64"][0], ">Q")]
+    elif b"stco" in table:
+        chunk_offsets = [offset for offset, in parse_full_box_table(moov, table[b"stco"][0], ">I")]
+    else:
+        raise SeekIndexError("Video track has no chunk offsets")
+
+    stsz = table[b"stsz"][0]
+    uniform_size, sample_count = struct.unpack_from(">II", moov, stsz + 4)
+    sizes = (array('I', [uniform_size]) * sample_count if uniform_size
+             else array('I', struct.unpack_from(f">{sample_count}I", moov, stsz + 12)))
+    sync = None
+    if b"stss" in table:
+        sync = {number for number, in parse_full_box_table(moov, table[b"stss"][0], ">I")}
+
+    times = array('q')
+    decode_time = 0
+    for count, delta in stts:
+        for _ in range(count):
+            times.append(decode_time)
+            decode_time += delta
+
+    points: List[Tuple[float, int]] = []
+    sample = 1
+    last_time = -MIN_POINT_SPACING
+    for entry, (first_chunk, per_chunk, _) in enumerate(stsc):
+        last_chunk = stsc[entry + 1][0] - 1 if entry + 1 < len(stsc) else len(chunk_offsets)
+        for chunk in range(first_chunk, last_chunk + 1):
+            offset = chunk_offsets[chunk - 1]
+            for _ in range(per_chunk):
+                if sample > sample_count:
+                    break
+                if sample <= len(times):
+                    seconds = times[sample - 1] / timescale
+                    if sync is None:
+                        if seconds - last_time >= MIN_POINT_SPACING:
+                            points.append((seconds, offset))
+                            last_time = seconds
+                    elif sample in sync:
+                        points.append((seconds, offset))
+                offset += sizes[sample - 1]
+                sample += 1
+    return SeekIndex(MP4, duration / timescale, points)
+
+
+async def build_mp4_index(read: Reader, file_size: int) -> SeekIndex:
+    start, size = await find_moov(read, file_size)
+    if size > MAX_INDEX_BYTES:
+        raise SeekIndexError(f"moov box too large ({size} bytes)")
+    moov = await read(start, size)
+    if len(moov) < size:
+        raise SeekIndexError("Truncated moov box")
+    # Walking every sample of a long film takes a while in Python.
+    return await asyncio.to_thread(parse_mp4_index, moov)
+
+
+# Matroska
+
+def read_vint(data: bytes, pos: int, keep_marker: bool = False) -> Tuple[Optional[int], int]:
+    # Returns (value, next position). A size with every bit set means
+    # "unknown" and is returned as None.
+    if pos >= len(data):
+        raise SeekIndexError("Truncated EBML data")
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8 or pos + length > len(data):
+        raise SeekIndexError("Invalid EBML variable length integer")
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, pos + length
+    return value, pos + length
+
+
+def read_element_header(data: bytes, pos: int) -> Tuple[int, Optional[int], int]:
+    element_id, pos = read_vint(data, pos, keep_marker=True)
+    size, pos = read_vint(data, pos)
+    return element_id, size, pos
+
+
+def iter_elements(data: bytes, start: int = 0, end: Optional[int] = None) -> Iterator[Tuple[int, int, int]]:
+    # Yields (id, payload_start, payload_end); stops at a truncated or
+    # unknown-sized element.
+    end = len(data) if end is None else end
+    pos = start
+    while pos < end:
+        try:
+            element_id, size, payload = read_element_header(data, pos)
+        except SeekIndexError:
+            return
+        if size is None or payload + size > end:
+            return
+        yield element_id, payload, payload + size
+        pos = payload + size
+
+
+def read_uint(data: bytes, start: int, end: int) -> int:
+    return int.from_bytes(data[start:end], 'big')
+
+
+def read_float(data: bytes, start: int, end: int) -> float:
+    if end - start == 4:
+        return struct.unpack_from(">f", data, start)[0]
+    if end - start == 8:
+        return struct.unpack_from(">d", data, start)[0]
+    return 0.0
+
+
+def parse_mkv_seek_head(data: bytes, start: int, end: int) -> Dict[int, int]:
+    positions = {}
+    for element_id, seek_start, seek_end in iter_elements(data, start, end):
+        if element_id != MKV_SEEK:
+            continue
+        target = position = None
+        for child_id, child_start, child_end in iter_elements(data, seek_start, seek_end):
+            if child_id == MKV_SEEK_ID:
+                target = read_uint(data, child_start, child_end)
+            elif child_id == MKV_SEEK_POSITION:
+                position = read_uint(data, child_start, child_end)
+        if target is not None and position is not None:
+            positions.setdefault(target, position)
+    return positions
+
+
+def parse_mkv_info(data: bytes, start: int, end: int) -> Tuple[int, float]:
+    timecode_scale, duration = 1000000, 0.0
+    for element_id, child_start, child_end in iter_elements(data, start, end):
+        if element_id == MKV_TIMECODE_SCALE:
+            timecode_scale = read_uint(data, child_start, child_end) or timecode_scale
+        elif element_id == MKV_DURATION:
+            duration = read_float(data, child_start, child_end)
+    return timecode_scale, duration
+
+
+def parse_mkv_video_track(data: bytes, start: int, end: int) -> Optional[int]:
+    for element_id, entry_start, entry_end in iter_elements(data, start, end):
+        if element_id != MKV_TRACK_ENTRY:
+            continue
+        number = track_type = None
+        for child_id, child_start, child_end in iter_elements(data, entry_start, entry_end):
+            if child_id == MKV_TRACK_NUMBER:
+                number = read_uint(data, child_start, child_end)
+            elif child_id == MKV_TRACK_TYPE:
+                track_type = read_uint(data, child_start, child_end)
+        if track_type == MKV_VIDEO_TRACK:
+            return number
+    return None
+
+
+def parse_mkv_cues(data: bytes, segment_start: int, timecode_scale: int,
+                   video_track: Optional[int]) -> List[Tuple[float, int]]:
+    points = []
+    for element_id, point_start, point_end in iter_elements(data):
+        if element_id != MKV_CUE_POINT:
+            continue
+        cue_time = None
+        positions = []
+        for child_id, child_start, child_end in iter_elements(data, point_start, point_end):
+            if child_id == MKV_CUE_TIME:
+                cue_time = read_uint(data, child_start, child_end)
+            elif child_id == MKV_CUE_TRACK_POSITIONS:
+                track = cluster = None
+                for pos_id, pos_start, pos_end in iter_elements(data, child_start, child_end):
+                    if pos_id == MKV_CUE_TRACK:
+                        track = read_uint(data, pos_start, pos_end)
+                    elif pos_id == MKV_CUE_CLUSTER_POSITION:
+                        cluster = read_uint(data, pos_start, pos_end)
+                if cluster is not None and (video_track is None or track == video_track):
+                    positions.append(cluster)
+        if cue_time is not None and positions:
+            points.append((cue_time * timecode_scale / 1e9, segment_start + positions[0]))
+    return points
+
+
+async def read_mkv_element(read: Reader, file_size: int, offset: int,
+                           expected_id: int) -> bytes:
+    header = await read(offset, 12)
+    element_id, size, payload = read_element_header(header, 0)
+    if element_id != expected_id or size is None:
+        raise SeekIndexError(f"Expected element {expected_id:#x} at {offset}")
+    if size > MAX_INDEX_BYTES or offset + payload + size > file_size:
+        raise SeekIndexError(f"Element {expected_id:#x} too large ({size} bytes)")
+    return await read(offset + payload, size)
+
+
+async def build_mkv_index(read: Reader, file_size: int) -> SeekIndex:
+    head = await read(0, min(file_size, MKV_HEAD_BYTES))
+    element_id, size, pos = read_element_header(head, 0)
+    if element_id != EBML_HEADER or size is None:
+        raise SeekIndexError("Missing EBML header")
+    element_id, _, segment_start = read_element_header(head, pos + size)
+    if element_id != MKV_SEGMENT:
+        raise SeekIndexError("Missing Segment element")
+
+    # Top-level elements found in the head, then anything the SeekHead
+    # points to that lies beyond it.
+    found: Dict[int, Tuple[int, int]] = {}
+    positions: Dict[int, int] = {}
+    for child_id, child_start, child_end in iter_elements(head, segment_start):
+        found.setdefault(child_id, (child_start, child_end))
+        if child_id == MKV_SEEK_HEAD:
+            positions.update(parse_mkv_seek_head(head, child_start, child_end))
+
+    async def element(target: int) -> Optional[bytes]:
+        if target in found:
+            return head[found[target][0]:found[target][1]]
+        if target in positions:
+            return await read_mkv_element(read, file_size, segment_start + positions[target], target)
+        return None
+
+    cues = await element(MKV_CUES)
+    if cues is None:
+        raise SeekIndexError("No Cues element referenced by the SeekHead")
+    info = await element(MKV_INFO)
+    timecode_scale, duration = parse_mkv_info(info, 0, len(info)) if info else (1000000, 0.0)
+    tracks = await element(MKV_TRACKS)
+    video_track = parse_mkv_video_track(tracks, 0, len(tracks)) if tracks else None
+
+    points = await asyncio.to_thread(
+        parse_mkv_cues, cues, segment_start, timecode_scale, video_track)
+    if not points and video_track is not None:
+        points = await asyncio.to_thread(
+            parse_mkv_cues, cues, segment_start, timecode_scale, None)
+    return SeekIndex(MKV, duration * timecode_scale / 1e9, points)
+
+
+class SeekIndexCache:
+    # Indexes by unique_id, least recently used dropped first. Files that
+    # cannot be indexed are remembered as None so they are parsed once.
+    __slots__ = ('max_entries', '_entries', 'built', 'failed')
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max(0, max_entries)
+        self._entries: OrderedDict[str, Optional[SeekIndex]] = OrderedDict()
+        self.built = 0
+        self.failed = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def contains(self, unique_id: str) -> bool:
+        return unique_id in self._entries
+
+    def get(self, unique_id: str) -> Optional[SeekIndex]:
+        index = self._entries.get(unique_id)
+        if unique_id in self._entries:
+            self._entries.move_to_end(unique_id)
+        return index
+
+    def set(self, unique_id: str, index: Optional[SeekIndex]) -> None:
+        if not self.enabled:
+            return
+        if index is None:
+            self.failed += 1
+        else:
+            self.built += 1
+        self._entries[unique_id] = index
+        self._entries.move_to_end(unique_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "built": self.built,
+            "failed": self.failed
+        }
+
+
+seek_index_cache = SeekIndexCache(Var.SEEK_INDEX_CACHE_SIZE)
@@ -0,0 +1,136 @@
+# Thunder/utils/worker_loads.py
+
+import asyncio
+import zlib
+from typing import Any, Dict, Optional
+
+from Thunder.bot import work_loads
+from Thunder.utils.logger import logger
+
+PUBLISH_INTERVAL = 1.0
+IP_SLOTS = 4096
+
+
+class SharedLoads:
+    # A workers x clients table of work_loads in shared memory. Each web
+    # worker writes only its own row; any process can read the totals.
+    def __init__(self) -> None:
+        self.table: Optional[Any] = None
+        self.workers = 0
+        self.max_clients = 0
+        self.index: Optional[int] = None
+
+    @property
+    def active(self) -> bool:
+        return self.table is not None
+
+    def create(self, context: Any, workers: int, max_clients: int) -> Any:
+        self.table = context.Array('q', workers * max_clients, lock=False)
+        self.workers = workers
+        self.max_clients = max_clients
+        return self.table
+
+    def attach(self, table: Any, workers: int, max_clients: int, index: int) -> None:
+        self.table = table
+        self.workers = workers
+        self.max_clients = max_clients
+        self.index = index
+
+    def publish(self) -> None:
+        if self.table is None or self.index is None:
+            return
+        base = self.index * self.max_clients
+        for client_id in range(self.max_clients):
+            self.table[base + client_id] = work_loads.get(client_id, 0)
+
+    def clear(self, index: int) -> None:
+        if self.table is None:
+            return
+        base = index * self.max_clients
+        for client_id in range(self.max_clients):
+            self.table[base + client_id] = 0
+
+    def per_worker(self) -> Dict[int, Dict[int, int]]:
+        if self.table is None:
+            return {}
+        return {
+            index: {
+                client_id: self.table[index * self.max_clients + client_id]
+                for client_id in range(self.max_clients)
+            }
+            for index in range(self.workers)
+        }
+
+    def totals(self) -> Dict[int, int]:
+        if self.table is None:
+            return dict(work_loads)
+        totals = {client_id: 0 for client_id in range(self.max_clients)}
+        for loads in self.per_worker().values():
+            for client_id, load in loads.items():
+                totals[client_id] += load
+        return totals
+
+    async def run(self) -> None:
+        while True:
+            try:
+                self.publish()
+                await asyncio.sleep(PUBLISH_INTERVAL)
+            except asyncio.CancelledError:
+                logger.debug("Worker load publisher cancelled cleanly.")
+                break
+            except Exception as e:
+                logger.error(f"Error publishing worker loads: {e}", exc_info=True)
+                await asyncio.sleep(PUBLISH_INTERVAL)
+
+
+class SharedIPStreams:
+    # A workers x IP_SLOTS table of open media streams per client address
+    # in shared memory, so per-IP limits hold across web workers. Each
+    # worker updates only its own row as its streams open and close.
+    # Addresses are hashed into slots; two sharing a slot share a count,
+    # which can only make a limit stricter.
+    def __init__(self) -> None:
+        self.table: Optional[Any] = None
+        self.workers = 0
+        self.index: Optional[int] = None
+
+    @property
+    def active(self) -> bool:
+        return self.table is not None and self.index is not None
+
+    def create(self, context: Any, workers: int) -> Any:
+        self.table = context.Array('q', workers * IP_SLOTS, lock=False)
+        self.workers = workers
+        return self.table
+
+    def attach(self, table: Any, workers: int, index: int) -> None:
+        self.table = table
+        self.workers = workers
+        self.index = index
+
+    @staticmethod
+    def slot(ip: str) -> int:
+        return zlib.crc32(ip.encode()) % IP_SLOTS
+
+    def add(self, ip: str, delta: int) -> None:
+        if not self.active:
+            return
+        self.table[self.index * IP_SLOTS + self.slot(ip)] += delta
+
+    def elsewhere(self, ip: str) -> int:
+        # Streams from `ip` open in the other workers.
+        if not self.active:
+            return 0
+        slot = self.slot(ip)
+        return sum(self.table[index * IP_SLOTS + slot]
+                   for index in range(self.workers) if index != self.index)
+
+    def clear(self, index: int) -> None:
+        if self.table is None:
+            return
+        base = index * IP_SLOTS
+        self.table[base:base + IP_SLOTS] = [0] * IP_SLOTS
+
+
+shared_loads = SharedLoads()
+shared_ip_streams = SharedIPStreams()
@@ -44,6 +44,9 @@ class Var:
         raise ValueError("BIN_CHANNEL is required")
 
     PORT: int = int(os.getenv("PORT", "8080"))
+    WEB_WORKERS: int = int(os.getenv("WEB_WORKERS", "1"))
+    DOWNLOAD_WORKERS: int = int(os.getenv("DOWNLOAD_WORKERS", "0"))
+    DOWNLOAD_WORKER_SLOTS: int = int(os.getenv("DOWNLOAD_WORKER_SLOTS", "8"))
     BIND_ADDRESS: str = os.getenv("BIND_ADDRESS", "0.0.0.0")
     PING_INTERVAL: int = int(os.getenv("PING_INTERVAL", "840"))
     NO_PORT: bool = str_to_bool(os.getenv("NO_PORT", "True"))
@@ -100,3 +103,39 @@ class Var:
     MAX_FILES_PER_PERIOD: int = int(os.getenv("MAX_FILES_PER_PERIOD", "2"))
     RATE_LIMIT_PERIOD_MINUTES: int = int(os.getenv("RATE_LIMIT_PERIOD_MINUTES", "1"))
     MAX_QUEUE_SIZE: int = int(os.getenv("MAX_QUEUE_SIZE", "100"))
+
+    FILE_INFO_CACHE_SIZE: int = int(os.getenv("FILE_INFO_CACHE_SIZE", "4096"))
+    FILE_INFO_CACHE_TTL: int = int(os.getenv("FILE_INFO_CACHE_TTL", "3600"))
+    CHUNK_CACHE_SIZE_MB: int = int(os.getenv("CHUNK_CACHE_SIZE_MB", "256"))
+    DISK_CACHE_DIR: str = os.getenv("DISK_CACHE_DIR", "disk_cache")
+    DISK_CACHE_SIZE_MB: int = int(os.getenv("DISK_CACHE_SIZE_MB", "0"))
+    PINNED_CACHE_SIZE_MB: int = int(os.getenv("PINNED_CACHE_SIZE_MB", "64"))
+    PIN_HEAD_KB: int = int(os.getenv("PIN_HEAD_KB", "1024"))
+    PIN_TAIL_KB: int = int(os.getenv("PIN_TAIL_KB", "1024"))
+    SEEK_INDEX_CACHE_SIZE: int = int(os.getenv("SEEK_INDEX_CACHE_SIZE", "512"))
+
+    READ_AHEAD_CHUNKS: int = int(os.getenv("READ_AHEAD_CHUNKS", "4"))
+    STREAM_BUFFER_MB: int = int(os.getenv("STREAM_BUFFER_MB", "64"))
+    PACING_SECONDS: int = int(os.getenv("PACING_SECONDS", "30"))
+    STRIPE_CLIENTS: int = int(os.getenv("STRIPE_CLIENTS", "1"))
+    STRIPE_MIN_SIZE_MB: int = int(os.getenv("STRIPE_MIN_SIZE_MB", "16"))
+    STREAM_WRITE_BUFFER_KB: int = int(os.getenv("STREAM_WRITE_BUFFER_KB", "256"))
+
+    MEDIA_SESSION_STORE: str = os.getenv("MEDIA_SESSION_STORE", "media_sessions.json")
+    MEDIA_SESSION_DCS: Set[int] = str_to_int_set(os.getenv("MEDIA_SESSION_DCS", ""))
+    MEDIA_SESSION_KEEPALIVE: int = int(os.getenv("MEDIA_SESSION_KEEPALIVE", "300"))
+
+    CIRCUIT_BREAKER_FAILURES: int = int(os.getenv("CIRCUIT_BREAKER_FAILURES", "5"))
+    CIRCUIT_BREAKER_COOLDOWN: int = int(os.getenv("CIRCUIT_BREAKER_COOLDOWN", "60"))
+
+    BANDWIDTH_GLOBAL_KBPS: int = int(os.getenv("BANDWIDTH_GLOBAL_KBPS", "0"))
+    BANDWIDTH_PER_IP_KBPS: int = int(os.getenv("BANDWIDTH_PER_IP_KBPS", "0"))
+    BANDWIDTH_PER_CONNECTION_KBPS: int = int(os.getenv("BANDWIDTH_PER_CONNECTION_KBPS", "0"))
+
+    MAX_STREAMS_PER_IP: int = int(os.getenv("MAX_STREAMS_PER_IP", "0"))
+    STREAM_RETRY_AFTER: int = int(os.getenv("STREAM_RETRY_AFTER", "5"))
+    TRUSTED_PROXIES: str = os.getenv("TRUSTED_PROXIES", "")
+    MAX_CONCURRENT_PER_CLIENT: int = int(os.getenv("MAX_CONCURRENT_PER_CLIENT", "0"))
+    ADMISSION_QUEUE_SIZE: int = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+    ADMISSION_QUEUE_TIMEOUT: int = int(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+    INTERACTIVE_RANGE_MB: int = int(os.getenv("INTERACTIVE_RANGE_MB", "16"))
@@ -0,0 +1,273 @@
+# Thunder/workers.py
+
+import asyncio
+import multiprocessing
+import os
+import signal
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Set
+
+from pyrogram.errors import FileReferenceExpired, FloodWait
+
+from Thunder.utils.config_parser import TokenParser
+from Thunder.utils.logger import logger
+from Thunder.utils.worker_loads import shared_ip_streams, shared_loads
+from Thunder.vars import Var
+
+SUPERVISE_INTERVAL = 5
+STOP_TIMEOUT = 10
+
+
+def worker_share(value: int, workers: int) -> int:
+    # 0 means disabled or unlimited and stays 0; a positive total never
+    # rounds down to 0.
+    return max(1, value // workers) if value > 0 else value
+
+
+def scope_settings(index: int, workers: int) -> None:
+    # Caches and process-wide budgets live in each worker's memory, so
+    # every worker gets its own disk cache directory and an equal share of
+    # the configured totals. Runs before the server modules are imported.
+    Var.DISK_CACHE_DIR = os.path.join(Var.DISK_CACHE_DIR, f"worker-{index}")
+    Var.DISK_CACHE_SIZE_MB = worker_share(Var.DISK_CACHE_SIZE_MB, workers)
+    Var.CHUNK_CACHE_SIZE_MB = worker_share(Var.CHUNK_CACHE_SIZE_MB, workers)
+    Var.PINNED_CACHE_SIZE_MB = worker_share(Var.PINNED_CACHE_SIZE_MB, workers)
+    Var.STREAM_BUFFER_MB = worker_share(Var.STREAM_BUFFER_MB, workers)
+    Var.BANDWIDTH_GLOBAL_KBPS = worker_share(Var.BANDWIDTH_GLOBAL_KBPS, workers)
+    Var.MAX_CONCURRENT_PER_CLIENT = worker_share(Var.MAX_CONCURRENT_PER_CLIENT, workers)
+
+
+async def start_media_clients(sessions: Optional[Dict[int, str]] = None) -> None:
+    from pyrogram.storage import MemoryStorage
+
+    from Thunder.bot import StreamBot
+    from Thunder.bot.clients import initialize_clients
+
+    # Updates and the session file belong to the bot process; here the
+    # clients only read media. With sessions exported by the parent they
+    # resume its authorization rather than signing each bot in again.
+    sessions = sessions or {}
+    StreamBot.no_updates = True
+    StreamBot.in_memory = True
+    StreamBot.storage = MemoryStorage(StreamBot.name, sessions.get(0))
+    try:
+        await StreamBot.start()
+    except FloodWait as e:
+        logger.debug(f"FloodWait in worker client start, sleeping for {e.value}s")
+        await asyncio.sleep(e.value)
+        await StreamBot.start()
+    StreamBot.username = (await StreamBot.get_me()).username
+    await initialize_clients(sessions)
+
+
+def wait_for_stop() -> asyncio.Event:
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop_event.set)
+    return stop_event
+
+
+async def cancel_tasks(tasks: List[asyncio.Task]) -> None:
+    for task in tasks:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+
+async def serve_streams(reuse_port: bool = False,
+                        sessions: Optional[Dict[int, str]] = None) -> None:
+    from aiohttp import web
+
+    from Thunder.bot.clients import cleanup_clients, export_sessions
+    from Thunder.server import web_server
+    from Thunder.utils.download_pool import download_pool
+    from Thunder.utils.media_sessions import media_session_pool
+
+    await start_media_clients(sessions)
+    download_pool.start(await export_sessions())
+
+    app_runner = web.AppRunner(await web_server())
+    await app_runner.setup()
+    site = web.TCPSite(app_runner, Var.BIND_ADDRESS, Var.PORT, reuse_port=reuse_port)
+    await site.start()
+
+    background_tasks = [
+        asyncio.create_task(media_session_pool.run(), name="media_session_task"),
+        asyncio.create_task(shared_loads.run(), name="shared_loads_task")
+    ]
+    stop_event = wait_for_stop()
+
+    try:
+        await stop_event.wait()
+    finally:
+        await cancel_tasks(background_tasks)
+        try:
+            await app_runner.cleanup()
+        except Exception as e:
+            logger.error(f"Error during web server cleanup: {e}")
+        await download_pool.stop()
+        try:
+            await cleanup_clients()
+        except Exception as e:
+            logger.error(f"Error during client cleanup: {e}")
+
+
+def run_worker(index: int, workers: int, table: Any, ip_table: Any, max_clients: int,
+               sessions: Dict[int, str]) -> None:
+    from uvloop import install
+    install()
+
+    scope_settings(index, workers)
+    shared_loads.attach(table, workers, max_clients, index)
+    shared_ip_streams.attach(ip_table, workers, index)
+    try:
+        asyncio.run(serve_streams(reuse_port=True, sessions=sessions))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        logger.error(f"Stream worker {index} failed: {e}", exc_info=True)
+        raise
+
+
+async def serve_downloads(index: int, conn: Connection, shm_name: str, slot_size: int,
+                          sessions: Dict[int, str]) -> None:
+    from multiprocessing import shared_memory
+
+    from pyrogram.file_id import FileId
+
+    from Thunder.bot.clients import cleanup_clients
+    from Thunder.server.exceptions import FileNotFound
+    from Thunder.utils.custom_dl import get_streamer
+    from Thunder.utils.media_sessions import media_session_pool
+
+    shm = shared_memory.SharedMemory(name=shm_name, track=False)
+    await start_media_clients(sessions)
+    loop = asyncio.get_running_loop()
+    stop_event = wait_for_stop()
+    requests: Set[asyncio.Task] = set()
+
+    async def handle(request_id: int, client_id: int, encoded_id: str,
+                     offset: int, limit: int, slot: int) -> None:
+        try:
+            data = await get_streamer(client_id).request_part(
+                FileId.decode(encoded_id), offset, limit)
+            start = slot * slot_size
+            shm.buf[start:start + len(data)] = data
+            reply = ("ok", len(data))
+        except FloodWait as e:
+            reply = ("flood", e.value)
+        except FileReferenceExpired as e:
+            reply = ("reference_expired", str(e))
+        except FileNotFound as e:
+            reply = ("not_found", str(e))
+        except Exception as e:
+            reply = ("error", f"{type(e).__name__}: {e}")
+        try:
+            conn.send((request_id, *reply))
+        except (BrokenPipeError, OSError):
+            stop_event.set()
+
+    def on_request() -> None:
+        try:
+            while conn.poll():
+                task = loop.create_task(handle(*conn.recv()))
+                requests.add(task)
+                task.add_done_callback(requests.discard)
+        except (EOFError, OSError):
+            # The web process is gone.
+            stop_event.set()
+
+    loop.add_reader(conn.fileno(), on_request)
+    conn.send((None, "ready", None))
+    keepalive_task = asyncio.create_task(
+        media_session_pool.run(), name="media_session_task")
+    logger.debug(f"Download worker {index} ready")
+
+    try:
+        await stop_event.wait()
+    finally:
+        loop.remove_reader(conn.fileno())
+        await cancel_tasks([keepalive_task, *requests])
+        try:
+            await cleanup_clients()
+        except Exception as e:
+            logger.error(f"Error during client cleanup: {e}")
+        shm.close()
+
+
+def run_download_worker(index: int, conn: Connection, shm_name: str, slot_size: int,
+                        sessions: Dict[int, str]) -> None:
+    from uvloop import install
+    install()
+
+    # Download workers only fetch parts; caching and pacing stay in the
+    # web process that owns the response.
+    Var.DISK_CACHE_SIZE_MB = 0
+    Var.CHUNK_CACHE_SIZE_MB = 0
+    Var.PINNED_CACHE_SIZE_MB = 0
+    Var.DOWNLOAD_WORKERS = 0
+    try:
+        asyncio.run(serve_downloads(index, conn, shm_name, slot_size, sessions))
+    except KeyboardInterrupt:
+        pass
+
+
+class WorkerPool:
+    # Web workers are separate spawned processes that all bind Var.PORT
+    # with SO_REUSEPORT, so the kernel spreads connections across them.
+    # Each one runs its own client pool, resumed from the bot process's
+    # sessions; the bot process only supervises.
+    def __init__(self, count: int, sessions: Dict[int, str]) -> None:
+        self.count = count
+        self.sessions = sessions
+        self.context = multiprocessing.get_context("spawn")
+        self.max_clients = len(TokenParser().parse_from_env()) + 1
+        self.table = shared_loads.create(self.context, count, self.max_clients)
+        self.ip_table = shared_ip_streams.create(self.context, count)
+        self.processes: Dict[int, Any] = {}
+        self.restarts = 0
+
+    def _spawn(self, index: int) -> None:
+        process = self.context.Process(
+            target=run_worker,
+            args=(index, self.count, self.table, self.ip_table, self.max_clients,
+                  self.sessions),
+            name=f"stream-worker-{index}")
+        process.start()
+        self.processes[index] = process
+
+    def start(self) -> None:
+        for index in range(self.count):
+            self._spawn(index)
+
+    async def supervise(self) -> None:
+        while True:
+            try:
+                await asyncio.sleep(SUPERVISE_INTERVAL)
+                for index, process in list(self.processes.items()):
+                    if process.is_alive():
+                        continue
+                    logger.warning(
+                        f"Stream worker {index} exited with code {process.exitcode}, restarting")
+                    shared_loads.clear(index)
+                    shared_ip_streams.clear(index)
+                    self.restarts += 1
+                    self._spawn(index)
+            except asyncio.CancelledError:
+                logger.debug("Worker supervisor cancelled cleanly.")
+                break
+            except Exception as e:
+                logger.error(f"Worker supervisor error: {e}", exc_info=True)
+
+    async def stop(self) -> None:
+        for process in self.processes.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes.values():
+            await asyncio.to_thread(process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                process.kill()